@@ -1 +1,9 @@
 import agents.prob
+import agents.transition
+import agents.model
+import agents.batch
+import agents.stats
+import agents.particle
+import agents.infogain
+import agents.planner
+import agents.qmdp
@@ -0,0 +1,143 @@
+# batch.py
+# Localization of many robots on the same map at once
+
+import numpy as np
+
+from gridutil import *
+from agents.model import LocModel
+
+
+class BatchLocAgent:
+    """
+    Estimates localization of many robots on the same map. Map-derived model is computed once and posteriors of all
+    robots are kept in one (robots x free states) array, so each step is a few NumPy operations for all robots instead
+    of separate LocAgent for each of them.
+    """
+
+    # possible actions, heuristic returns indices into this list (see gridutil.Action)
+    actions = ACTIONS
+
+    def __init__(self, size, walls, eps_perc, eps_move, n_robots, transition='sparse', model=None,
+                 confidence=0.85, rng=None):
+        self.size = size
+        self.walls = walls
+        self.n_robots = n_robots
+        # probability of most probable location above which robots stop exploring
+        self.confidence = confidence
+        # random generator for random moves of heuristic
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        # previous action of each robot as Action, -1 before first action
+        self.prev_actions = np.full(n_robots, -1)
+
+        # map-derived sensor and motion model shared by all robots
+        self.model = model if model is not None else LocModel(size, walls, eps_perc, eps_move, transition)
+
+        # uniform posterior over valid locations and directions for each robot, one row per robot. Robots can
+        # never be in walls, so only free states (see LocModel.free_states) are kept
+        self.P = np.tile(self.model.prior()[self.model.free_states], (n_robots, 1))
+        # posteriors of all states in grid form (robot, x, y, direction), allocated and filled only by get_posterior
+        # of all robots, as it takes memory of the whole map for each robot
+        self.P_grid = None
+
+    def __call__(self, percepts):
+        """
+        Updates posterior of each robot given its current percept and returns next action of each robot
+        as indices into self.actions.
+        """
+        masks = self.percept_masks(percepts)
+        self.update(masks, self.prev_actions)
+        action_idx = self.heuristic(masks)
+        self.prev_actions = action_idx
+
+        return action_idx
+
+    @staticmethod
+    def percept_masks(percepts):
+        """
+        Returns array of percept masks given lists of strings or percept masks.
+        """
+        if isinstance(percepts, np.ndarray) and percepts.dtype.kind in 'iu':
+            return percepts
+        return np.array([p if isinstance(p, (int, np.integer)) else perceptToMask(p) for p in percepts], int)
+
+    @staticmethod
+    def action_codes(actions):
+        """
+        Returns array of actions as gridutil.Action (-1 for no action) given names, None or Action.
+        """
+        if isinstance(actions, np.ndarray) and actions.dtype.kind in 'iu':
+            return actions
+        return np.array([toAction(a) if a is not None else -1 for a in actions], int)
+
+    def heuristic(self, percepts):
+        """
+        The same heuristic as LocAgent.heuristic for all robots at once. Drives robots in a corner while touching
+        wall and moves them in a random way when we reach confidence of robot location.
+        Returns indices of actions in self.actions.
+        """
+        masks = self.percept_masks(percepts)
+        fwd = (masks & perceptToMask(['fwd'])) > 0
+        right = (masks & perceptToMask(['right'])) > 0
+        left = (masks & perceptToMask(['left'])) > 0
+        confident = self.most_probable()[3] >= self.confidence
+
+        turnleft, turnright, forward = Action
+        random_turn = self.rng.choice([turnleft, turnright], self.n_robots)
+        random_move = self.rng.choice([forward, turnleft, turnright], self.n_robots, p=[0.95, 0.025, 0.025])
+
+        # if there's wall in front and on the left then turn right, if there's wall in front and on the right then
+        # turn left, otherwise turn left or right
+        wall_ahead = np.where(left & ~right, turnright, np.where(~left & right, turnleft, random_turn))
+        # when we are not sure move while touching wall or turn to touch it, when we are sure prefer moving forward
+        no_wall_ahead = np.where(confident, random_move, np.where(right | left, forward, random_turn))
+
+        return np.where(fwd, wall_ahead, no_wall_ahead)
+
+    def update(self, percepts, actions):
+        """
+        Updates posterior of each robot given its current percept and previous action as Action (-1 if robot didn't
+        act yet). Percepts are lists of strings or percept masks (see gridutil.perceptToMask), actions may also be
+        given as names (None if robot didn't act yet).
+        """
+        masks = self.percept_masks(percepts)
+        actions = self.action_codes(actions)
+
+        # transition factor is the same for all robots with the same previous action
+        for action in np.unique(actions):
+            robots = np.flatnonzero(actions == action)
+            kernel = self.model.free_kernel(int(action) if action >= 0 else None)
+            self.P[robots] = kernel.predict(self.P[robots])
+
+        # update posterior with sensor factor of each robot's percept
+        self.P *= self.model.sensor_factor(masks, free_only=True)
+        # normalize posterior of each robot so its sum = 1
+        self.P /= self.P.sum(axis=1, keepdims=True)
+
+    def most_probable(self):
+        """
+        Returns most probable location (x, y), direction and its probability for each robot as four arrays.
+        """
+        free_idx = np.argmax(self.P, axis=1)
+        prob = self.P[np.arange(self.n_robots), free_idx]
+        states = self.model.free_states[free_idx]
+        loc_idx, dir_idx = np.divmod(states, len(self.model.directions))
+        x, y = np.divmod(loc_idx, self.size)
+        return x, y, dir_idx, prob
+
+    def get_posterior(self, robot=None):
+        """
+        Returns posterior of each location and directions in this location in array form for given robot, or for all
+        robots (robot, x, y, direction) if robot is None. Posterior of one robot is a new array, posterior of all
+        robots is refilled on each call.
+        """
+        grid_shape = (self.size, self.size, len(self.model.directions))
+        if robot is not None:
+            P_grid = np.zeros(self.model.n_states)
+            P_grid[self.model.free_states] = self.P[robot]
+            return P_grid.reshape(grid_shape)
+
+        if self.P_grid is None:
+            self.P_grid = np.zeros((self.n_robots,) + grid_shape)
+        self.P_grid.reshape(self.n_robots, -1)[:, self.model.free_states] = self.P
+        return self.P_grid
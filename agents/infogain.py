@@ -0,0 +1,131 @@
+# infogain.py
+# Choosing actions that are expected to give the most information about robot's location
+
+import numpy as np
+
+from gridutil import *
+
+
+def code_masses(model, P, codes=None):
+    """
+    Returns sum of P and sum of P * log(P) over states with each obstacle code (see LocModel.obstacle_codes).
+    P is flat array of all states, or of states with given codes.
+    """
+    n_codes = 1 << len(model.percept_names)
+    codes = model.obstacle_codes if codes is None else codes
+    with np.errstate(divide='ignore', invalid='ignore'):
+        P_log_P = np.where(P > 0, P * np.log(P), 0.0)
+    return np.bincount(codes, P, minlength=n_codes), np.bincount(codes, P_log_P, minlength=n_codes)
+
+
+def percept_probs(model):
+    """
+    Returns probabilities of sensor readings without bump given obstacle code, probs[mask, code] for masks 0-15.
+    Each of four readings is independent and correct with probability SENS_CORRECT.
+    """
+    n_codes = 1 << len(model.percept_names)
+    correct = ~(model.code_obstacles[:n_codes, np.newaxis, :] ^ model.code_obstacles[np.newaxis, :, :])
+    return np.where(correct, model.SENS_CORRECT, model.SENS_FALSE).prod(axis=-1)
+
+
+def percept_tables(model):
+    """
+    Returns tables used by percept_outcomes which depend only on the model: sensor factor F[mask, code] of all 32
+    percept masks, F * log(F) and probabilities of readings without bump (see percept_probs)
+    """
+    F = model.percept_factors(np.arange(1 << len(PERCEPTS)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        F_log_F = np.where(F > 0, F * np.log(F), 0.0)
+    return F, F_log_F, percept_probs(model)
+
+
+def support_codes(model, support):
+    """
+    Returns obstacle code of each state of posterior given as flat array of all states (support is None) or of
+    free states in support (indices into model.free_states)
+    """
+    if support is None:
+        return model.obstacle_codes
+    return model.free_codes if len(support) == len(model.free_states) else model.free_codes[support]
+
+
+def percept_outcomes(model, P, action, tables=None, support=None):
+    """
+    Returns predicted probability of states after action, their support, probability of each of 32 next percept
+    masks and entropy of posterior after each of them, given current posterior P as flat array of all states.
+    With support (indices into model.free_states, see LocAgent.support_eps) P holds probabilities of states in
+    support only and outcomes are evaluated over free kernel of the action, so their cost depends on size of
+    support. Otherwise returned support is None and predicted probability is given for all states.
+
+    Posterior after percept mask z is proportional to predicted probability of state times sensor factor
+    F[z, code], and both depend on state only through its obstacle code. So with B[code] = sum of predicted
+    probabilities and E[code] = sum of p * log(p) over states with the code, entropy of posterior after z is
+        log(Z[z]) - (F @ E + (F * log(F)) @ B)[z] / Z[z],  where Z = F @ B
+    and all 32 percepts are evaluated with a few (32 x 16) matrix products. Only forward can cause bump: robot
+    bumps when its move succeeded but there's wall in front.
+
+    tables returned by percept_tables can be passed when outcomes are evaluated many times on the same model.
+    """
+    F, F_log_F, probs = tables if tables is not None else percept_tables(model)
+
+    codes = support_codes(model, support)
+    if support is None:
+        new_support, predicted = None, model.kernel(action).predict(P)
+    else:
+        new_support, predicted = model.free_kernel(action).predict_support(support, P)
+    B, E = code_masses(model, predicted, support_codes(model, new_support))
+
+    Z = F.dot(B)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        H = np.where(Z > 0, np.log(Z) - (F.dot(E) + F_log_F.dot(B)) / Z, 0.0)
+
+    # probability of each percept mask. Robot bumps with probability of successful move from states with wall
+    # in front. As in sensor factor, forward reading is then certain, so readings of bumped robot have
+    # probabilities F of bump masks (other outcomes would make the filter drop the true state and are not
+    # counted as information)
+    bumped = np.zeros_like(B)
+    if actionName(action) == 'forward':
+        blocked = (codes & 1) > 0
+        bumped = model.MOVE_CORRECT * np.bincount(codes[blocked], P[blocked], minlength=len(B))
+    p_percept = np.concatenate([probs.dot(B - bumped), F[len(probs):].dot(bumped)])
+
+    return predicted, new_support, p_percept, H
+
+
+def expected_entropies(model, P, actions=ACTIONS, tables=None, support=None):
+    """
+    Returns expected entropy of posterior after each of given actions and next percept (see percept_outcomes),
+    given current posterior P as flat array of all states or of free states in support.
+    """
+    if tables is None:
+        tables = percept_tables(model)
+    entropies = []
+    for action in actions:
+        _, _, p_percept, H = percept_outcomes(model, P, action, tables, support)
+        entropies.append(p_percept.dot(H))
+    return np.array(entropies)
+
+
+def entropy(P):
+    """
+    Returns entropy of probabilities P
+    """
+    P = P[P > 0]
+    return -P.dot(np.log(P))
+
+
+def infogain_action(model, P, min_gain=0.1, support=None):
+    """
+    Returns Action with the lowest expected entropy of posterior (the largest expected information gain), given
+    posterior P as flat array of all states (or of free states in support, see percept_outcomes), or None if no
+    action is expected to lower entropy by at least min_gain. Forward wins ties.
+
+    Looking one step ahead, turning never gains information (robot sees the same walls from another side), so when
+    moving forward doesn't either, caller has to explore some other way.
+    """
+    order = [Action.FORWARD, Action.TURNLEFT, Action.TURNRIGHT]
+    entropies = expected_entropies(model, P, order, support=support)
+    best = int(np.argmin(entropies))
+    if entropy(P) - entropies[best] < min_gain:
+        return None
+    return order[best]
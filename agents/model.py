@@ -0,0 +1,253 @@
+# model.py
+# Sensor and motion model of robot on a given map, shared by localization agents
+
+import numpy as np
+
+import maps
+from gridutil import *
+from agents.transition import SparseTransition, DenseTransition, StencilTransition
+
+
+class LocModel:
+    """
+    Everything that can be computed from the map and noise levels only: walls around each location, transition
+    factors for each action and sensor factors for percepts. It never changes, so one model can be shared by many
+    agents (and robots) on the same map.
+
+    States are locations in grid with four directions each, index of state is (x * size + y) * 4 + direction.
+    """
+
+    def __init__(self, size, walls, eps_perc, eps_move, transition='sparse', cache_sensor=True):
+        self.size = size
+        # list of walls locations or occupancy grid (see maps.map_occupancy)
+        self.walls = walls
+
+        # neighbours for each direction in percepts order (forward, right, backward, left)
+        self.directions = {'N': [(0, 1), (1, 0), (0, -1), (-1, 0)],
+                           'E': [(1, 0), (0, -1), (-1, 0), (0, 1)],
+                           'S': [(0, -1), (-1, 0), (0, 1), (1, 0)],
+                           'W': [(-1, 0), (0, 1), (1, 0), (0, -1)]}
+
+        # forward neighbour for each direction (N, E, S, W)
+        self.forward_neighbours = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+
+        # free[x, y] is True if location (x, y) is not a wall
+        self.free = ~maps.walls_occupancy(self.walls, self.size)
+
+        # neighbours[x * size + y, dir_idx] is index of location in front of location (x, y) when facing dir_idx
+        # (in the same x * size + y form) or -1 if it's outside of the world
+        xs, ys = np.divmod(np.arange(self.size * self.size), self.size)
+        self.neighbours = np.full((self.size * self.size, len(self.forward_neighbours)), -1)
+        for dir_idx, (dx, dy) in enumerate(self.forward_neighbours):
+            nx, ny = xs + dx, ys + dy
+            inside = (nx >= 0) & (nx < self.size) & (ny >= 0) & (ny < self.size)
+            self.neighbours[inside, dir_idx] = nx[inside] * self.size + ny[inside]
+
+        # blocked[x * size + y, dir_idx] is True if there's wall (or end of the world) in front of location (x, y)
+        # when facing dir_idx
+        self.blocked = (self.neighbours < 0) | ~self.free.reshape(-1)[self.neighbours]
+
+        # indices of states in free locations, robot can never be in other states
+        self.free_states = np.flatnonzero(np.repeat(self.free.reshape(-1), len(self.directions)))
+
+        # Transition Factor for each location and direction. 'sparse' keeps only possible moves of robot,
+        # 'stencil' shifts probabilities on the grid without any matrix,
+        # 'dense' keeps full (states x states) matrix and is meant only for small maps
+        if transition not in ('sparse', 'stencil', 'dense'):
+            raise ValueError(f"Unknown transition factor: {transition}")
+        self.transition = transition
+
+        # probabilities of correct and failed move of robot on given action
+        self.MOVE_CORRECT = 1-eps_move
+        self.MOVE_FAILED = eps_move
+
+        # map doesn't change, so transition factor for each action is built only once, when it's first needed
+        self.kernels = {}
+        # transition factors over free states only, built when needed
+        self.free_kernels = {}
+
+        # names of percepts in relative directions order (forward, right, backward, left)
+        self.percept_names = ['fwd', 'right', 'bckwd', 'left']
+
+        # obstacles[x, y, dir_idx, rel_idx] is True if there's wall (or end of the world) next to location (x, y)
+        # in relative direction rel_idx when robot is facing direction dir_idx. Relative direction rel_idx for
+        # direction dir_idx is direction (dir_idx + rel_idx) % 4
+        dirs = np.arange(len(self.directions))
+        rel_dirs = (dirs[:, np.newaxis] + np.arange(len(self.percept_names))) % len(self.directions)
+        self.obstacles = self.blocked[:, rel_dirs].reshape(self.size, self.size, len(self.directions),
+                                                          len(self.percept_names))
+
+        # sensor factor depends only on which of four relative directions are blocked, so each state gets a code
+        # with bit rel_idx set if there's wall in relative direction rel_idx
+        rel_bits = 1 << np.arange(len(self.percept_names))
+        self.obstacle_codes = (self.obstacles * rel_bits).sum(axis=3).reshape(-1)
+        self.free_codes = self.obstacle_codes[self.free_states]
+        # code_obstacles[code, rel_idx] is True if code has wall in relative direction rel_idx
+        self.code_obstacles = (np.arange(1 << len(self.percept_names))[:, np.newaxis] & rel_bits) > 0
+
+        # probabilities of correct and false values returned by sensor
+        self.SENS_CORRECT = 1-eps_perc
+        self.SENS_FALSE = eps_perc
+        self.SENS_BUMP = 1
+
+        # there are only 32 percept masks, so sensor factor of all states (and its logarithm) for each mask is
+        # computed the first time the mask is seen and reused afterwards. Keys are (mask, free_only). Each entry
+        # takes memory of one posterior, cache_sensor=False turns caching off for huge maps
+        self.cache_sensor = cache_sensor
+        self.sensor_factors = {}
+        self.log_sensor_factors = {}
+
+    @property
+    def n_states(self):
+        return self.size * self.size * len(self.directions)
+
+    def prior(self):
+        """
+        Returns uniform probability over valid locations and directions as flat array of states. Walls have zero
+        probability.
+        """
+        P = np.repeat(self.free.reshape(-1, 1), len(self.directions), axis=1).reshape(-1).astype(float)
+        return P / P.sum()
+
+    def kernel(self, action):
+        """
+        Returns transition factor for given previous action (name or Action). Without previous action robot is
+        treated as if it moved forward.
+        """
+        action = actionName(action) if action is not None else 'forward'
+        if action not in self.kernels:
+            self.kernels[action] = self.build_transition_factor(action)
+        return self.kernels[action]
+
+    def percept_factors(self, masks):
+        """
+        Returns sensor factor for each obstacle code (see self.obstacle_codes) given percept mask (see
+        gridutil.perceptToMask). For array of masks returns array of factors, one row for each mask.
+
+        Each percept is correct when sensor detected wall and it is there or didn't detect wall and it is NOT there.
+        If bump was detected, forward reading for locations with wall in front is 100% correct when sensor detected
+        the wall and 100% false when it didn't.
+        """
+        masks = np.asarray(masks)
+        # observed[..., rel_idx] is True if sensor detected wall in relative direction rel_idx
+        observed = (masks[..., np.newaxis] & (1 << np.arange(len(self.percept_names)))) > 0
+        bump = (masks & perceptToMask(['bump'])) > 0
+
+        correct = self.code_obstacles == observed[..., np.newaxis, :]
+        factors = np.where(correct, self.SENS_CORRECT, self.SENS_FALSE)
+
+        bump_factor = np.where(observed[..., 0], self.SENS_BUMP, 0)
+        bumped = bump[..., np.newaxis] & self.code_obstacles[:, 0]
+        factors[..., 0] = np.where(bumped, bump_factor[..., np.newaxis], factors[..., 0])
+
+        # multiply factors of all percepts for each code
+        return factors.prod(axis=-1)
+
+    def sensor_factor(self, masks, free_only=False):
+        """
+        Returns sensor factor for each state given percept mask, as flat array of states (or free states only if
+        free_only is True). For array of masks returns array of factors, one row for each mask.
+
+        Factor of single mask is cached (see self.sensor_factors) and returned read-only.
+        """
+        codes = self.free_codes if free_only else self.obstacle_codes
+        if np.ndim(masks) > 0 or not self.cache_sensor:
+            return self.percept_factors(masks)[..., codes]
+
+        key = (int(masks), free_only)
+        if key not in self.sensor_factors:
+            factor = self.percept_factors(key[0])[codes]
+            factor.flags.writeable = False
+            self.sensor_factors[key] = factor
+        return self.sensor_factors[key]
+
+    def log_sensor_factor(self, mask, free_only=False):
+        """
+        Returns logarithm of sensor factor (see sensor_factor) of single percept mask. Impossible states get -inf.
+        """
+        key = (int(mask), free_only)
+        if key in self.log_sensor_factors:
+            return self.log_sensor_factors[key]
+
+        with np.errstate(divide='ignore'):
+            log_factor = np.log(self.sensor_factor(mask, free_only))
+        if self.cache_sensor:
+            log_factor.flags.writeable = False
+            self.log_sensor_factors[key] = log_factor
+        return log_factor
+
+    def build_transition_factor(self, action):
+        """
+        Builds transition factor for given action.
+
+        From each state robot can only stay or reach one successor state, so factor is stored as SparseTransition.
+        With 'dense' transition it is converted to full matrix. 'stencil' transition doesn't need any precomputation
+        besides walls in front of each location.
+        """
+        if self.transition == 'stencil':
+            return StencilTransition(action, self.free, self.MOVE_CORRECT, self.MOVE_FAILED)
+
+        T = self.sparse_transition(action)
+        if self.transition == 'dense':
+            T = DenseTransition(T.toarray())
+        return T
+
+    def free_kernel(self, action):
+        """
+        Returns sparse transition factor for given previous action over free states only (see self.free_states).
+        Robot never leaves free states, so agents that don't need posterior in grid form can skip walls.
+        """
+        action = actionName(action) if action is not None else 'forward'
+        if action not in self.free_kernels:
+            T = self.sparse_transition(action)
+            # index of each free state in self.free_states
+            free_idx = np.full(self.n_states, -1)
+            free_idx[self.free_states] = np.arange(len(self.free_states))
+            self.free_kernels[action] = SparseTransition(T.stay[self.free_states], free_idx[T.succ[self.free_states]],
+                                                         T.move[self.free_states])
+        return self.free_kernels[action]
+
+    def sparse_transition(self, action):
+        """
+        Builds transition factor for given action as SparseTransition.
+        """
+        n_dirs = len(self.directions)
+        states = np.arange(self.n_states)
+        # location and direction of each state
+        state_loc, state_dir = np.divmod(states, n_dirs)
+
+        # if previous action was turn right then robot stayed in same position but changed its direction
+        if action == 'turnright':
+            # transition from W to N direction wraps around
+            succ = state_loc * n_dirs + (state_dir + 1) % n_dirs
+            stay = np.full(len(states), self.MOVE_FAILED)
+            move = np.full(len(states), self.MOVE_CORRECT)
+
+        # if previous action was turn left then robot stayed in same position but changed its direction
+        elif action == 'turnleft':
+            # transition from N to W direction wraps around
+            succ = state_loc * n_dirs + (state_dir - 1) % n_dirs
+            stay = np.full(len(states), self.MOVE_FAILED)
+            move = np.full(len(states), self.MOVE_CORRECT)
+
+        # else if previous action was forward then robot moved to new location and saved its direction
+        elif action == 'forward':
+            # if forward location in considered direction is wall that means that robot stayed in last location
+            succ = states.copy()
+            stay = np.ones(len(states), float)
+            move = np.zeros(len(states), float)
+
+            # robot can move if it's in free location and location in front of it is free
+            can_move = (self.free.reshape(-1, 1) & ~self.blocked).reshape(-1)
+            # index of location in front with the same direction
+            new_loc_idx_D = self.neighbours.reshape(-1) * n_dirs + state_dir
+
+            succ[can_move] = new_loc_idx_D[can_move]
+            # probability that robot stayed in current location even though forward was last action
+            stay[can_move] = self.MOVE_FAILED
+            # probability that robot moved to new location
+            move[can_move] = self.MOVE_CORRECT
+        else:
+            raise ValueError(f"Unknown action: {action}")
+
+        return SparseTransition(stay, succ, move)
@@ -0,0 +1,162 @@
+# particle.py
+# Monte Carlo localization of robot with particle filter
+
+import numpy as np
+
+from gridutil import *
+from agents.prob import LocAgent
+
+
+def low_variance_resample(weights, n, rng):
+    """
+    Returns indices of n particles drawn with probabilities proportional to weights. Single random number places n
+    evenly spaced pointers on cumulative weights, so particles are drawn with lower variance than by independent
+    draws and particle with weight w is drawn at least floor(w * n) times.
+    """
+    cumulative = np.cumsum(weights)
+    pointers = (rng.random() + np.arange(n)) * (cumulative[-1] / n)
+    return np.minimum(np.searchsorted(cumulative, pointers, side='right'), len(weights) - 1)
+
+
+def kld_particles(k, epsilon, z):
+    """
+    Returns number of particles needed so that with probability given by z (upper quantile of standard normal
+    distribution) Kullback-Leibler divergence between particle approximation and true posterior is below epsilon,
+    when particles fall into k different states (Fox, KLD-sampling).
+    """
+    if k <= 1:
+        return 1
+    a = 2 / (9 * (k - 1))
+    return int(np.ceil((k - 1) / (2 * epsilon) * (1 - a + np.sqrt(a) * z) ** 3))
+
+
+class ParticleLocAgent(LocAgent):
+    """
+    Estimates localization of robot with a set of weighted particles instead of probability of every location and
+    direction, so memory and time of a step depend on number of particles and not on size of the map.
+
+    Each particle is a state (index (x * size + y) * 4 + direction, see LocModel). In each step particles are moved
+    by sampling the motion model of previous action and weighted by sensor factor of current percept. When weight
+    is carried by few particles, they are resampled with low-variance resampling and their number is adapted with
+    KLD-sampling between min_particles and max_particles: many while posterior is spread over the map, few once
+    robot is localized.
+
+    __call__, heuristic and get_posterior work the same way as in LocAgent, actions are chosen with wall-following
+    heuristic.
+    """
+
+    def __init__(self, size, walls, eps_perc, eps_move, n_particles=5000, min_particles=500, max_particles=50000,
+                 kld_epsilon=0.05, kld_z=2.326, resample_threshold=0.5, model=None, confidence=0.85, verbose=True,
+                 profile=False, rng=None):
+        super().__init__(size, walls, eps_perc, eps_move, model=model, confidence=confidence, verbose=verbose,
+                         profile=profile, exact=False)
+        # random generator of particles
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        # sensor factor of each obstacle code (see LocModel.obstacle_codes) for current percept
+        self.code_factors = np.ones(1 << len(self.model.percept_names))
+
+        # bounds and parameters of KLD-sampling
+        self.min_particles = min_particles
+        self.max_particles = max_particles
+        self.kld_epsilon = kld_epsilon
+        self.kld_z = kld_z
+        # particles are resampled when effective number of particles drops below this fraction of their number
+        self.resample_threshold = resample_threshold
+
+        # particles drawn uniformly from valid locations and directions, with equal weights
+        self.states = self.rng.choice(self.model.free_states, n_particles)
+        self.weights = np.full(n_particles, 1.0 / n_particles)
+
+        # posterior in grid form (x, y, direction), allocated and filled only by get_posterior, as it takes memory
+        # and time of the whole map
+        self.P = None
+        self.P_view = None
+
+    @property
+    def n_particles(self):
+        return len(self.states)
+
+    def update_sensor_factor(self, percept):
+        """
+        Sensor factor depends only on walls around the state, so it's kept for each of 16 obstacle codes
+        """
+        self.code_factors = self.model.percept_factors(perceptToMask(percept))
+
+    def update_transition_factor(self):
+        """
+        Particles are moved by sampling, so there's no factor to build
+        """
+        pass
+
+    def update_posterior(self):
+        """
+        Resamples particles if needed, moves them according to previous action and weights them by current percept.
+        """
+        # resampling adds noise, so particles are resampled only when few of them carry most of the weight
+        if 1.0 / np.square(self.weights).sum() < self.resample_threshold * self.n_particles:
+            self.resample()
+        self.move(self.prev_action)
+
+        weights = self.weights * self.code_factors[self.model.obstacle_codes[self.states]]
+        total = weights.sum()
+        if total == 0:
+            # no particle explains the percept, robot is lost, so particles are spread over the whole map again
+            self.states = self.rng.choice(self.model.free_states, self.n_particles)
+            weights = self.code_factors[self.model.obstacle_codes[self.states]]
+            total = weights.sum()
+            if total == 0:
+                weights, total = np.ones(self.n_particles), self.n_particles
+        self.weights = weights / total
+
+    def resample(self):
+        """
+        Draws new set of particles with equal weights from the weighted one. Number of particles is chosen with
+        KLD-sampling from number of different states occupied by particles.
+        """
+        k = len(np.unique(self.states[self.weights > 0]))
+        n = min(max(kld_particles(k, self.kld_epsilon, self.kld_z), self.min_particles), self.max_particles)
+        self.states = self.states[low_variance_resample(self.weights, n, self.rng)]
+        self.weights = np.full(n, 1.0 / n)
+
+    def move(self, action):
+        """
+        Moves each particle according to motion model of given action (forward if None): with probability
+        1 - eps_move robot turned or moved to location in front of it if it's not a wall.
+        """
+        action = toAction(action) if action is not None else Action.FORWARD
+        n_dirs = len(self.model.directions)
+        cells, headings = np.divmod(self.states, n_dirs)
+        moved = self.rng.random(self.n_particles) >= self.model.MOVE_FAILED
+
+        if action == Action.TURNLEFT:
+            headings = np.where(moved, (headings - 1) % n_dirs, headings)
+        elif action == Action.TURNRIGHT:
+            headings = np.where(moved, (headings + 1) % n_dirs, headings)
+        else:
+            go = moved & ~self.model.blocked[cells, headings]
+            cells = np.where(go, self.model.neighbours[cells, headings], cells)
+        self.states = cells * n_dirs + headings
+
+    def most_probable(self):
+        """
+        Returns most probable location (x, y), direction and its probability given by weights of particles in it
+        """
+        states, idx = np.unique(self.states, return_inverse=True)
+        probs = np.bincount(idx, self.weights, minlength=len(states))
+        best = np.argmax(probs)
+        loc_idx, dir_idx = np.divmod(states[best], len(self.model.directions))
+        x, y = np.divmod(loc_idx, self.size)
+        return x, y, dir_idx, probs[best]
+
+    def get_posterior(self):
+        """
+        returns posterior of each location and directions in this location in array form, as sum of weights of
+        particles in each state. It is a read-only view of array which is refilled on each call.
+        """
+        if self.P is None:
+            self.P = np.zeros((self.size, self.size, len(self.model.directions)), float)
+            self.P_view = self.P.view()
+            self.P_view.flags.writeable = False
+        self.P.reshape(-1)[:] = np.bincount(self.states, self.weights, minlength=self.P.size)
+        return self.P_view
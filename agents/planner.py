@@ -0,0 +1,139 @@
+# planner.py
+# Multi-step lookahead of robot's actions
+
+import time
+
+import numpy as np
+
+from gridutil import *
+from agents.infogain import percept_tables, percept_outcomes, expected_entropies, entropy, support_codes
+
+
+class BudgetExceeded(Exception):
+    """Planning ran out of its time budget"""
+
+
+class LookaheadPlanner:
+    """
+    Depth-limited expectimax over actions and percepts. Value of posterior after depth more actions is its entropy,
+    robot chooses actions with the lowest expected value and percepts are averaged with their probabilities.
+
+    Last level of the tree is evaluated for all actions and percepts at once with agents.infogain, so depth 1 is the
+    same as greedy information gain. Percept branches with probability below prune_prob are skipped, values of
+    identical posteriors are memoized and depth is increased one by one (iterative deepening) while the search
+    fits in time_budget seconds.
+
+    Memoized values are kept between plans (up to max_memo of them), as posterior after the chosen action and
+    observed percept is one of the nodes expanded in previous plan, so shallower iterations of next plan are found
+    in memo. After each plan last_stats holds planning time, reached depth, number of expanded nodes (posteriors
+    computed) and memoization hits.
+
+    Posterior can be given over states in support only (see LocAgent.support_eps), then the whole tree is evaluated
+    over free kernels and states reachable from the support.
+    """
+
+    def __init__(self, model, depth=2, prune_prob=0.01, time_budget=0.1, min_gain=0.1, max_memo=100000):
+        self.model = model
+        self.depth = depth
+        self.prune_prob = prune_prob
+        self.time_budget = time_budget
+        # minimum expected decrease of entropy for which planned action is worth taking
+        self.min_gain = min_gain
+        # tables of percept outcomes, the first one is sensor factor of each percept mask (rows) for each obstacle
+        # code (columns)
+        self.tables = percept_tables(model)
+        self.F = self.tables[0]
+
+        self.order = [Action.FORWARD, Action.TURNLEFT, Action.TURNRIGHT]
+        # (posterior key, depth) -> expected entropy after each action in self.order followed by depth - 1 actions
+        self.memo = {}
+        self.max_memo = max_memo
+        self.nodes = 0
+        self.memo_hits = 0
+        self.deadline = None
+        self.last_stats = {}
+
+    def plan(self, P, support=None):
+        """
+        Returns Action with the lowest expected entropy after lookahead, given posterior P as flat array of all
+        states (or of free states in support, see agents.infogain.percept_outcomes), or None if no action is
+        expected to lower entropy by at least min_gain. Forward wins ties.
+        """
+        start = time.perf_counter()
+        self.deadline = start + self.time_budget
+        self.nodes = 0
+        self.memo_hits = 0
+
+        values = None
+        depth = 0
+        for d in range(1, self.depth + 1):
+            try:
+                values = self.action_values(P, d, support)
+            except BudgetExceeded:
+                break
+            depth = d
+
+        if len(self.memo) > self.max_memo:
+            self.memo = {}
+        self.last_stats = {'time': time.perf_counter() - start, 'depth': depth, 'nodes': self.nodes,
+                           'memo_hits': self.memo_hits}
+        if values is None:
+            return None
+        best = int(np.argmin(values))
+        if entropy(P) - values[best] < self.min_gain:
+            return None
+        return self.order[best]
+
+    def action_values(self, P, depth, support=None):
+        """
+        Returns expected entropy after depth actions for each first action in self.order
+        """
+        key = (self.belief_key(P, support), depth)
+        values = self.memo.get(key)
+        if values is not None:
+            self.memo_hits += 1
+            return values
+        if time.perf_counter() > self.deadline:
+            raise BudgetExceeded()
+
+        if depth == 1:
+            values = expected_entropies(self.model, P, self.order, self.tables, support)
+        else:
+            values = np.array([self.action_value(P, action, depth, support) for action in self.order])
+        self.memo[key] = values
+        return values
+
+    def action_value(self, P, action, depth, support=None):
+        """
+        Returns expected entropy after given action followed by depth - 1 best actions
+        """
+        predicted, new_support, p_percept, _ = percept_outcomes(self.model, P, action, self.tables, support)
+        codes = support_codes(self.model, new_support)
+        value = 0.0
+        kept = 0.0
+        for mask in np.flatnonzero(p_percept >= self.prune_prob):
+            posterior = predicted * self.F[mask, codes]
+            posterior_support = new_support
+            if new_support is not None:
+                # states ruled out by the percept are dropped from support
+                possible = posterior > 0
+                posterior, posterior_support = posterior[possible], new_support[possible]
+            total = posterior.sum()
+            if total == 0:
+                continue
+            self.nodes += 1
+            value += p_percept[mask] * self.action_values(posterior / total, depth - 1, posterior_support).min()
+            kept += p_percept[mask]
+
+        # probabilities of pruned percepts are spread over the kept ones
+        return value / kept if kept > 0 else entropy(P)
+
+    @staticmethod
+    def belief_key(P, support=None):
+        """
+        Returns key of posterior for memoization. Probabilities are rounded, so posteriors that differ only by
+        rounding errors of different paths share the key.
+        """
+        if support is None:
+            return hash(np.round(P, 12).tobytes())
+        return hash((support.tobytes(), np.round(P, 12).tobytes()))
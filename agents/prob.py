@@ -5,6 +5,11 @@ import random
 import numpy as np
 
 from gridutil import *
+from agents.model import LocModel
+from agents.stats import PhaseStats
+from agents.infogain import infogain_action
+from agents.planner import LookaheadPlanner
+from agents.qmdp import QMDPPolicy
 
 
 best_turn = {('N', 'E'): 'turnright',
@@ -23,126 +28,310 @@ best_turn = {('N', 'E'): 'turnright',
 
 class LocAgent:
 
-    def __init__(self, size, walls, eps_perc, eps_move):
+    def __init__(self, size, walls, eps_perc, eps_move, transition='sparse', log_space=False, model=None,
+                 confidence=0.85, verbose=True, profile=False, support_eps=None, reexpand_mass=0.999,
+                 policy='heuristic', planner_depth=2, planner_budget=0.1, goal=None, qmdp_cache=None,
+                 exact=True):
         self.size = size
         self.walls = walls
-        # list of valid locations
-        self.locations = list({*locations(self.size)}.difference(self.walls))
-        # dictionary from location to its index in the list
-        self.loc_to_idx = {loc: idx for idx, loc in enumerate(self.locations)}
+        # print state of the agent in each step
+        self.verbose = verbose
+        # probability of most probable location above which robot stops exploring
+        self.confidence = confidence
+
+        # map-derived sensor and motion model, can be shared with other agents on the same map
+        self.model = model if model is not None else LocModel(size, walls, eps_perc, eps_move, transition)
+
+        # how next action is chosen: 'heuristic' follows walls, 'infogain' maximizes expected information gain,
+        # 'planner' looks planner_depth actions ahead in at most planner_budget seconds, 'qmdp' uses value function
+        # of the map for reaching goal location (x, y) or places with rare walls if goal is None, cached in
+        # qmdp_cache directory
+        if policy not in ('heuristic', 'infogain', 'planner', 'qmdp'):
+            raise ValueError(f"Unknown policy: {policy}")
+        self.policy = policy
+        self.planner = LookaheadPlanner(self.model, planner_depth, time_budget=planner_budget) \
+            if policy == 'planner' else None
+        self.qmdp_policy = QMDPPolicy(self.model, goal, cache_dir=qmdp_cache) if policy == 'qmdp' else None
 
         # previous action
         self.prev_action = None
 
-        # neighbours for each direction in percepts order (forward, right, backward, left)
-        self.directions = {'N': [(0, 1), (1, 0), (0, -1), (-1, 0)],
-                           'E': [(1, 0), (0, -1), (-1, 0), (0, 1)],
-                           'S': [(0, -1), (-1, 0), (0, 1), (1, 0)],
-                           'W': [(-1, 0), (0, 1), (1, 0), (0, -1)]}
+        # time spent in each phase of steps (see profiled_step), None if profiling is disabled
+        self.stats = PhaseStats() if profile else None
+
+        # with support_eps only states with probability at least support_eps (support) are tracked, as indices into
+        # model.free_states and their probabilities, so step cost depends on number of plausible states instead of
+        # size of the map. When pruning would drop more than 1 - reexpand_mass of probability, states aren't pruned
+        # in that step. self.P is kept equal to the tracked belief
+        self.support_eps = support_eps
+        self.reexpand_mass = reexpand_mass
+        # while support is larger than this fraction of free states, it's cheaper to predict all free states at once
+        # than to merge states reached from the support
+        self.dense_support = 0.03
+        if self.support_eps is not None and log_space:
+            raise ValueError("Sparse support can't be tracked in log space")
+
+        # in log space posterior is updated as logarithms of probabilities, which don't underflow on long runs.
+        # self.P is then recomputed from them after each update
+        self.log_space = log_space
+
+        # subclasses which keep belief in other form (see agents.particle) skip exact posterior with exact=False
+        if exact:
+            self.init_posterior()
+
+    def init_posterior(self):
+        """
+        Builds uniform posterior over all states and factors updating it
+        """
+        # Transition Factor for previous action
+        self.T = None
+
+        # Sensor factor for each location in grid. Each location contains four possible directions
+        self.sensor = np.ones((self.size, self.size, len(self.model.directions)), float)
+
+        # uniform posterior over valid locations and directions, kept in grid form (x, y, direction).
+        # Walls have zero probability
+        self.P = self.model.prior().reshape(self.sensor.shape)
+        # posterior is updated in place, so read-only view of it can be handed out once and stays valid
+        self.P_view = self.P.view()
+        self.P_view.flags.writeable = False
+
+        if self.support_eps is not None:
+            self.support = np.arange(len(self.model.free_states))
+            self.support_P = self.P.reshape(-1)[self.model.free_states]
+            # sensor factor of each obstacle code (see LocModel.obstacle_codes) for current percept
+            self.code_factors = np.ones(1 << len(self.model.percept_names))
+
+        if self.log_space:
+            with np.errstate(divide='ignore'):
+                self.log_P = np.log(self.P)
+                self.log_sensor = np.log(self.sensor)
 
-        # forward neighbour for each direction (N, E, S, W)
-        self.forward_neighbours = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+    def __call__(self, percept):
+        """
+        Updates posterior given current percept and returns next action. Percept given as list of strings is answered
+        with action name, percept mask (see gridutil.perceptToMask) with Action.
+        """
+        mask = perceptToMask(percept) if percept is not None else None
 
-        # Transition Factor for each location.
-        self.T = np.zeros((len(self.locations)*len(self.directions), len(self.locations)*len(self.directions)),
-                          float)
-        # fill diagonal with initial probabilty that robot is there and has this direction
-        np.fill_diagonal(self.T, 1)
+        # update posterior
+        if self.verbose:
+            print(f"\n\n\nPrevious action: {actionName(self.prev_action) if self.prev_action is not None else None}")
+            print(f"Current percept: {maskToPercept(mask) if mask is not None else None}")
+        if self.stats is None:
+            self.update_sensor_factor(mask)
+            self.update_transition_factor()
+            self.update_posterior()
+            action = self.choose_action(mask)
+        else:
+            action = self.profiled_step(mask)
 
-        # probabilities of correct and failed move of robot on given action
-        self.MOVE_CORRECT = 1-eps_move
-        self.MOVE_FAILED = eps_move
+        if percept is not None and not hasattr(percept, '__index__'):
+            return actionName(action)
+        return action
 
-        # Sensor factor for each location. Each location contains four possible directions
-        self.sensor = np.ones((len(self.locations), len(self.directions)), float)
+    def profiled_step(self, mask):
+        """
+        The same step as in __call__, but time of each phase is added to self.stats. Posterior update is also
+        counted separately for each previous action, as transition factors of actions differ.
+        """
+        stats = self.stats
+        prev_action = actionName(self.prev_action) if self.prev_action is not None else 'none'
 
-        # probabilities of correct and false values returned by sensor
-        self.SENS_CORRECT = 1-eps_perc
-        self.SENS_FALSE = eps_perc
-        self.SENS_BUMP = 1
+        t0 = stats.clock()
+        self.update_sensor_factor(mask)
+        t1 = stats.clock()
+        self.update_transition_factor()
+        t2 = stats.clock()
+        self.update_posterior()
+        t3 = stats.clock()
+        action = self.choose_action(mask)
+        t4 = stats.clock()
+
+        stats.add('sensor', t1 - t0)
+        stats.add('transition', t2 - t1)
+        stats.add('posterior', t3 - t2)
+        stats.add(f'posterior[{prev_action}]', t3 - t2)
+        stats.add(self.policy, t4 - t3)
+        stats.add('step', t4 - t0)
+        return action
 
-        # uniform posterior over valid locations and directions
-        prob_loc = 1.0/(len(self.locations)*len(self.directions))
-        self.P = prob_loc * np.ones((len(self.locations) * len(self.directions), 1), np.float)
+    def choose_action(self, percept):
+        """
+        Returns next action chosen by agent's policy
+        """
+        if self.policy == 'infogain':
+            return self.infogain(percept)
+        if self.policy == 'planner':
+            return self.plan(percept)
+        if self.policy == 'qmdp':
+            return self.qmdp(percept)
+        return self.heuristic(percept)
+
+    def infogain(self, percept):
+        """
+        Returns Action after which posterior is expected to have the lowest entropy over all possible next percepts
+        (see agents.infogain). Once we reach confidence of robot location or no action is expected to give any
+        information, robot moves the same way as with heuristic.
+        """
+        if self.most_probable()[3] >= self.confidence:
+            return self.heuristic(percept)
 
-    def __call__(self, percept):
+        P, support = self.belief()
+        action = infogain_action(self.model, P, support=support)
+        if action is None:
+            return self.heuristic(percept)
+        if self.verbose:
+            print(f"Most informative action: {actionName(action)}")
 
-        # update posterior
-        print(f"\n\n\nPrevious action: {self.prev_action}")
-        print(f"Current percept: {percept}")
-        self.update_sensor_factor(percept)
-        self.update_transition_factor()
-        self.update_posterior()
-        action = self.heuristic(percept)
+        self.prev_action = action
+        return action
+
+    def plan(self, percept):
+        """
+        Returns first Action of the best plan found by lookahead over next actions and percepts (see agents.planner).
+        Once we reach confidence of robot location or no plan is expected to give any information, robot moves the
+        same way as with heuristic.
+        """
+        if self.most_probable()[3] >= self.confidence:
+            return self.heuristic(percept)
+
+        P, support = self.belief()
+        action = self.planner.plan(P, support)
+        planned = self.planner.last_stats
+        if self.stats is not None:
+            self.stats.add(f"planner[depth {planned['depth']}]", planned['time'])
+        if self.verbose:
+            print(f"Planned {planned['depth']} actions ahead in {planned['time'] * 1e3:.1f} ms, "
+                  f"{planned['nodes']} nodes expanded, {planned['memo_hits']} memo hits")
+        if action is None:
+            return self.heuristic(percept)
+        if self.verbose:
+            print(f"Planned action: {actionName(action)}")
 
+        self.prev_action = action
+        return action
+
+    def qmdp(self, percept):
+        """
+        Returns Action with the highest value averaged over posterior (see agents.qmdp). Without goal robot only
+        explores, so once we reach confidence of robot location it moves the same way as with heuristic. With goal
+        robot drives to it and once we are confident that it's there, it turns in place, as there's no action to stop.
+        Direction doesn't matter in goal, so confidence is probability of goal location over all directions, which
+        doesn't drop while robot turns.
+        """
+        goal = self.qmdp_policy.goal
+        if goal is None and self.most_probable()[3] >= self.confidence:
+            # turns in a row are counted only while QMDP chooses actions
+            self.qmdp_policy.reset()
+            return self.heuristic(percept)
+        if goal is not None and self.P[tuple(goal)].sum() >= self.confidence:
+            self.qmdp_policy.reset()
+            if self.verbose:
+                print(f"Goal {tuple(goal)} reached")
+            self.prev_action = Action.TURNRIGHT
+            return self.prev_action
+
+        action = self.qmdp_policy.action(self.P.reshape(-1), self.prev_action)
+        if self.verbose:
+            print(f"QMDP action: {actionName(action)}")
+
+        self.prev_action = action
         return action
 
+    def belief(self):
+        """
+        Returns posterior for policies (see agents.infogain.percept_outcomes): probabilities of states in support and
+        the support with sparse support, or flat array of all states and None otherwise
+        """
+        if self.support_eps is not None:
+            return self.support_P, self.support
+        return self.P.reshape(-1), None
+
     def heuristic(self, percept):
         """
         Returns action that drives robot in a corner while touching wall, which give us more information about
         location probability.
 
-        When we reach 85% confidence of robot location, then robot moves in a random way, not focusing on exploring
-        the world
+        When we reach confidence of robot location (85% by default), then robot moves in a random way, not focusing on
+        exploring the world
+
+        Percept is list of strings or percept mask, returned action is Action.
         """
 
-        # find index of most probable location and direction
-        loc_and_dir_idx = np.argmax(self.P[:, 0])
-        # calculate index of location
-        loc_idx = int(np.floor(loc_and_dir_idx/len(self.directions)))
-        # calculate index of direction
-        dir_idx = int(loc_and_dir_idx % len(self.directions))
-        orientations = ['N', 'E', 'S', 'W']
+        # find most probable location and direction
+        x, y, dir_idx, prob = self.most_probable()
+
+        if self.verbose:
+            print(f"Most probable location: {(int(x), int(y))}  {DIRECTIONS[dir_idx]}")
+            print(f"Probability of robot being in this location: {round(prob, 3)}")
 
-        print(f"Most probable location: {self.locations[loc_idx]}  {orientations[dir_idx]}")
-        print(f"Probability of robot being in this location: {round(self.P[loc_and_dir_idx, 0], 3)}")
+        action = Action.FORWARD
 
-        action = 'forward'
+        # walls detected in front, on the right and on the left
+        mask = perceptToMask(percept) if percept is not None else 0
+        fwd = mask & perceptToMask(['fwd'])
+        right = mask & perceptToMask(['right'])
+        left = mask & perceptToMask(['left'])
 
         # if we are not sure where robot is, plan robot move in a way that explore the world
-        if self.P[loc_and_dir_idx, 0] < 0.85:
+        if prob < self.confidence:
             if percept is not None:
-                if 'fwd' in percept:
+                if fwd:
                     # if there's wall in front and on the left then turn right
-                    if 'left' in percept and 'right' not in percept:
-                        action = 'turnright'
+                    if left and not right:
+                        action = Action.TURNRIGHT
                     # if there's wall in front and on the right then turn left
-                    elif 'left' not in percept and 'right' in percept:
-                        action = 'turnleft'
+                    elif not left and right:
+                        action = Action.TURNLEFT
                     # if there's wall only in front then turn left or right
                     # to force robot to move while touching wall
                     else:
-                        action = np.random.choice(['turnleft', 'turnright'], 1, p=[0.5, 0.5])
+                        action = Action(np.random.choice([Action.TURNLEFT, Action.TURNRIGHT], p=[0.5, 0.5]))
                 # force robot to move while touching wall
-                elif 'right' in percept or 'left' in percept:
-                    action = 'forward'
+                elif right or left:
+                    action = Action.FORWARD
                 # if there's wall in our back then turn right or turn left to touch wall
                 else:
-                    action = np.random.choice(['turnleft', 'turnright'], 1, p=[0.5, 0.5])
+                    action = Action(np.random.choice([Action.TURNLEFT, Action.TURNRIGHT], p=[0.5, 0.5]))
             # if there's no percepts force robot to move forward
             else:
-                print("NO PERCEPTS")
-                action = 'forward'
+                if self.verbose:
+                    print("NO PERCEPTS")
+                action = Action.FORWARD
         # heuristic when we are sure where robot is. Some random moves
         else:
-            print("JUST MOVE")
+            if self.verbose:
+                print("JUST MOVE")
             # if there is a wall ahead then lets turn
-            if 'fwd' in percept:
-                if 'left' in percept and 'right' not in percept:
-                    action = 'turnright'
-                elif 'left' not in percept and 'right' in percept:
-                    action = 'turnleft'
+            if fwd:
+                if left and not right:
+                    action = Action.TURNRIGHT
+                elif not left and right:
+                    action = Action.TURNLEFT
                 else:
-                    action = np.random.choice(['turnleft', 'turnright'], 1, p=[0.5, 0.5])
+                    action = Action(np.random.choice([Action.TURNLEFT, Action.TURNRIGHT], p=[0.5, 0.5]))
             else:
                 # prefer moving forward to explore
-                action = np.random.choice(['forward', 'turnleft', 'turnright'], 1, p=[0.95, 0.025, 0.025])
+                action = Action(np.random.choice([Action.FORWARD, Action.TURNLEFT, Action.TURNRIGHT],
+                                                 p=[0.95, 0.025, 0.025]))
 
         self.prev_action = action
 
         return action
 
 
+    def most_probable(self):
+        """
+        Returns most probable location (x, y), direction and its probability
+        """
+        if self.support_eps is not None:
+            best = np.argmax(self.support_P)
+            x, y, dir_idx = np.unravel_index(self.model.free_states[self.support[best]], self.P.shape)
+            return x, y, dir_idx, self.support_P[best]
+        x, y, dir_idx = np.unravel_index(np.argmax(self.P), self.P.shape)
+        return x, y, dir_idx, self.P[x, y, dir_idx]
+
     def update_sensor_factor(self, percept):
         """
         This function updates sensor factor for each possible location and direction in this location.
@@ -155,74 +344,19 @@ class LocAgent:
         For example if we are in location (loc[0], loc[1]) and we are considering SOUTH direction and BACKWARD percept
         then we have to check if there's wall in (loc[0], loc[1]+1), as BACKWARD in this case means NORTH
 
+        Walls around each location are precomputed in the model, so the factor for all locations and directions
+        is computed at once by comparing percepts with obstacles. Model computes it only the first time each percept
+        is seen, afterwards it's just looked up.
         """
+        mask = perceptToMask(percept)
+        if self.support_eps is not None:
+            # only states in support are updated, factor of each of them is looked up by its obstacle code
+            self.code_factors = self.model.percept_factors(mask)
+            return
+        self.sensor = self.model.sensor_factor(mask).reshape(self.sensor.shape)
 
-        # reset sensor factor before updating it
-        self.sensor[self.sensor > 0] = 1
-
-        for loc_idx, loc in enumerate(self.locations):  # loop over each location
-
-            for dir_idx, neigh in enumerate(self.directions.values()):  # loop over each direction
-                # for current considered direction check if there's wall in percept direction.
-
-                if 'fwd' in percept:
-                    if (loc[0] + neigh[0][0], loc[1] + neigh[0][1]) not in self.locations:
-                        if 'bump' in percept:
-                            # if bump was detected, that means that this sensor reading was 100% correct
-                            self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_BUMP
-                        else:
-                            # if percept was correct (Sensor detected wall in this direction and it is there)
-                            self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_CORRECT
-                    else:
-                        # if percept was NOT correct (Sensor detected wall in this direction, but it is NOT there)
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_FALSE
-                else:
-                    if (loc[0] + neigh[0][0], loc[1] + neigh[0][1]) not in self.locations:
-                        if 'bump' in percept:
-                            # if bump was detected and sensor returned nothing in forward direction that means that this
-                            # sensor reading is 100% false
-                            self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * 0
-                        else:
-                            # if lack of percept in this direction was NOT correct
-                            # (Sensor didn't detect wall in this direction, but the wall is there)
-                            self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_FALSE
-                    else:
-                        # if lack of percept in this direction was correct
-                        # (Sensor didn't detect wall in this direction and the wall is NOT there)
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_CORRECT
-
-                if 'right' in percept:
-                    if (loc[0] + neigh[1][0], loc[1] + neigh[1][1]) not in self.locations:
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_CORRECT
-                    else:
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_FALSE
-                else:
-                    if (loc[0] + neigh[1][0], loc[1] + neigh[1][1]) not in self.locations:
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_FALSE
-                    else:
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_CORRECT
-
-                if 'bckwd' in percept:
-                    if (loc[0] + neigh[2][0], loc[1] + neigh[2][1]) not in self.locations:
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_CORRECT
-                    else:
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_FALSE
-                else:
-                    if (loc[0] + neigh[2][0], loc[1] + neigh[2][1]) not in self.locations:
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_FALSE
-                    else:
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_CORRECT
-
-                if 'left' in percept:
-                    if (loc[0] + neigh[3][0], loc[1] + neigh[3][1]) not in self.locations:
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_CORRECT
-                    else:
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_FALSE
-                else:
-                    if (loc[0] + neigh[3][0], loc[1] + neigh[3][1]) not in self.locations:
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_FALSE
-                    else:
-                        self.sensor[loc_idx, dir_idx] = self.sensor[loc_idx, dir_idx] * self.SENS_CORRECT
+        if self.log_space:
+            self.log_sensor = self.model.log_sensor_factor(mask).reshape(self.sensor.shape)
 
     def update_transition_factor(self):
         """
@@ -238,141 +372,105 @@ class LocAgent:
         (5, 9) and last action was forward we have to check if there is wall in each direction ( [5, 10] -> N,
         [6,9] -> E, [5, 8] -> S, [4, 9] -> W) and update transition factor based on this information and slight chance
         that robot failed its last move.
-        """
-        # if previous action was turn right then robot stayed in same position but changed its direction
-        if self.prev_action == 'turnright':
-            # set to zero whole Transition factor and then fill diagonal with 1
-            self.T[self.T > 0] = 0
-            np.fill_diagonal(self.T, 1)
-
-            for loc_idx, loc in enumerate(self.locations):
-                loc_idx_N = loc_idx * len(self.directions)  # index of NORTH direction for current location
-
-                for dir_idx, direct in enumerate(self.directions):
-                    # calculate index for each direction in location
-                    loc_idx_D = loc_idx_N + dir_idx  # each location has 4 possible directions
-
-                    # calculate index for right direction in compare to last direction
-                    new_dir_idx_T = loc_idx_D + 1
-
-                    # transition from W to N direction
-                    if new_dir_idx_T > loc_idx_N + 3:
-                        new_dir_idx_T = loc_idx_N
-
-                    # set values for new direction and last direction
-                    self.T[loc_idx_D, new_dir_idx_T] = self.MOVE_CORRECT
-                    self.T[loc_idx_D, loc_idx_D] = self.MOVE_FAILED
 
-        # if previous action was turn left then robot stayed in same position but changed its direction
-        elif self.prev_action == 'turnleft':
-            # set to zero whole Transition factor and then fill diagonal with 1
-            self.T[self.T > 0] = 0
-            np.fill_diagonal(self.T, 1)
-
-            for loc_idx, loc in enumerate(self.locations):
-                loc_idx_N = loc_idx * len(self.directions)  # index of NORTH direction for current location
-
-                for dir_idx, direct in enumerate(self.directions):
-
-                    # calculate index for each direction in location
-                    loc_idx_D = loc_idx_N + dir_idx  # each location has 4 possible directions
-
-                    # calculate index for left direction in compare to last direction
-                    new_dir_idx_T = loc_idx_D - 1
-
-                    # transition from N to E direction
-                    if new_dir_idx_T < loc_idx_N:
-                        new_dir_idx_T = loc_idx_N + 3
-
-                    # set values for new direction and last direction
-                    self.T[loc_idx_D, new_dir_idx_T] = self.MOVE_CORRECT
-                    self.T[loc_idx_D, loc_idx_D] = self.MOVE_FAILED
-
-        # else if previous action was forward then robot moved to new location and saved its direction
-        else:
-            for loc_idx, loc in enumerate(self.locations):
-                for dir_idx, neigh in enumerate(self.forward_neighbours):
-                    new_loc = (loc[0] + neigh[0], loc[1] + neigh[1])
-
-                    # calculate index of location with direction in T matrix
-                    loc_idx_D = loc_idx * len(self.directions) + dir_idx  # each location has 4 possible directions
-
-                    if new_loc in self.locations:
-                        new_loc_idx = self.loc_to_idx[new_loc] * len(self.directions) + dir_idx
-                        self.T[loc_idx_D, :] = 0  # set whole row to 0 before modyfing it
-
-                        # probability that robot stayed in current location even though forward was last action
-                        self.T[loc_idx_D, loc_idx_D] = self.MOVE_FAILED
-                        # probability that robot moved to new location
-                        self.T[loc_idx_D, new_loc_idx] = self.MOVE_CORRECT
-                    else:
-                        # if forward location in considered direction is wall
-                        # that means that robot stayed in last location
-                        self.T[loc_idx_D, :] = 0
-                        self.T[loc_idx_D, loc_idx_D] = 1
+        Factors for all actions are built once in the model, here we only pick the one for previous action. With
+        sparse support the factor over free states is used directly (see update_sparse_posterior), so full-grid
+        factor isn't built at all.
+        """
+        if self.support_eps is not None:
+            return
+        self.T = self.model.kernel(self.prev_action)
 
     def update_posterior(self):
         """
         Updates posterior for each location and directions in this location.
         Based on data from sensor and transitions of robot.
         """
-        # reshape sensor array to match transition array shape
-        sensor_reshaped = self.sensor.reshape([len(self.locations)*len(self.directions), 1])
-        # transpose transition factor
-        self.T = self.T.transpose()
-        # update posterior
-        self.P = sensor_reshaped * self.T.dot(self.P)
+        if self.log_space:
+            self.update_log_posterior()
+            return
+        if self.support_eps is not None:
+            self.update_sparse_posterior()
+            return
+
+        # transition factors work on flattened grid of states
+        P = self.T.predict(self.P.reshape(-1)).reshape(self.P.shape)
+        # update posterior in place
+        np.multiply(self.sensor, P, out=self.P)
         # normalize posterior so its sum = 1
-        self.P = self.P / self.P.sum(axis=0, keepdims=1)
+        self.P /= self.P.sum()
+
+    def update_log_posterior(self):
+        """
+        Updates posterior the same way as update_posterior, but in log space. Sensor factor is added to logarithm of
+        predicted posterior and it's normalized with log-sum-exp.
+        """
+        log_P = self.T.log_predict(self.log_P.reshape(-1)).reshape(self.P.shape) + self.log_sensor
+        # normalize posterior so sum of probabilities = 1
+        log_max = log_P.max()
+        self.log_P = log_P - (log_max + np.log(np.exp(log_P - log_max).sum()))
+        np.exp(self.log_P, out=self.P)
+
+    def update_sparse_posterior(self):
+        """
+        Updates posterior of states in support only. Probability of each state in support is pushed to itself and its
+        successor, multiplied by sensor factor and states below support_eps are pruned. Large support is predicted
+        over all free states at once (see self.dense_support).
+        """
+        kernel = self.model.free_kernel(self.prev_action)
+        support = self.support
+        free_states = self.model.free_states
+        n_free = len(free_states)
+        new_support, P = kernel.predict_support(support, self.support_P, self.dense_support)
+        codes = self.model.free_codes if len(new_support) == n_free else self.model.free_codes[new_support]
+        P *= self.code_factors[codes]
+
+        total = P.sum()
+        if total == 0:
+            # percept is impossible in all tracked states, so they are forgotten and all free states are considered
+            new_support = np.arange(n_free)
+            P = self.code_factors[self.model.free_codes]
+            total = P.sum()
+        P /= total
+
+        keep = P >= self.support_eps
+        retained = P[keep].sum()
+        # pruned states would carry too much probability while belief is still spread, so nothing is pruned in this
+        # step and belief is kept as it is
+        if retained >= self.reexpand_mass:
+            new_support, P = new_support[keep], P[keep] / retained
+
+        # keep posterior in grid form equal to tracked belief
+        P_flat = self.P.reshape(-1)
+        if len(new_support) < n_free:
+            P_flat[free_states if len(support) == n_free else free_states[support]] = 0
+        P_flat[free_states if len(new_support) == n_free else free_states[new_support]] = P
+        self.support, self.support_P = new_support, P
 
     def get_posterior(self):
         """
-        returns posterior of each location and directions in this location in array form
+        returns posterior of each location and directions in this location in array form.
+        Posterior is already kept in this form, so returned array is a read-only view of it, which follows
+        later updates of the posterior. Copy it to keep posterior from given step.
         """
         # directions in order 'N', 'E', 'S', 'W'
-        P_arr = np.zeros([self.size, self.size, 4], dtype=np.float)
-
-        for loc_idx, loc in enumerate(self.locations):
-            # calculate index of location with NORTH direction
-            loc_idx_N = loc_idx*len(self.directions)
-            # get probabilities for all directions in current location
-            P_arr[loc[0], loc[1], :] = self.P[loc_idx_N:loc_idx_N + 4, 0]
-        return P_arr
+        return self.P_view
 
     def forward(self, cur_loc, cur_dir):
-        if cur_dir == 'N':
-            ret_loc = (cur_loc[0], cur_loc[1] + 1)
-        elif cur_dir == 'E':
-            ret_loc = (cur_loc[0] + 1, cur_loc[1])
-        elif cur_dir == 'W':
-            ret_loc = (cur_loc[0] - 1, cur_loc[1])
-        elif cur_dir == 'S':
-            ret_loc = (cur_loc[0], cur_loc[1] - 1)
+        # cur_dir is 'N', 'E', 'S', 'W' or heading (see gridutil.toHeading)
+        ret_loc = nextLoc(cur_loc, cur_dir)
         ret_loc = (min(max(ret_loc[0], 0), self.size - 1), min(max(ret_loc[1], 0), self.size - 1))
         return ret_loc, cur_dir
 
     def backward(self, cur_loc, cur_dir):
-        if cur_dir == 'N':
-            ret_loc = (cur_loc[0], cur_loc[1] - 1)
-        elif cur_dir == 'E':
-            ret_loc = (cur_loc[0] - 1, cur_loc[1])
-        elif cur_dir == 'W':
-            ret_loc = (cur_loc[0] + 1, cur_loc[1])
-        elif cur_dir == 'S':
-            ret_loc = (cur_loc[0], cur_loc[1] + 1)
+        ret_loc = nextLoc(cur_loc, nextDirection(cur_dir, 2))
         ret_loc = (min(max(ret_loc[0], 0), self.size - 1), min(max(ret_loc[1], 0), self.size - 1))
         return ret_loc, cur_dir
 
     @staticmethod
     def turnright(cur_loc, cur_dir):
-        dir_to_idx = {'N': 0, 'E': 1, 'S': 2, 'W': 3}
-        dirs = ['N', 'E', 'S', 'W']
-        idx = (dir_to_idx[cur_dir] + 1) % 4
-        return cur_loc, dirs[idx]
+        return cur_loc, rightTurn(cur_dir)
 
     @staticmethod
     def turnleft(cur_loc, cur_dir):
-        dir_to_idx = {'N': 0, 'E': 1, 'S': 2, 'W': 3}
-        dirs = ['N', 'E', 'S', 'W']
-        idx = (dir_to_idx[cur_dir] + 4 - 1) % 4
-        return cur_loc, dirs[idx]
+        return cur_loc, leftTurn(cur_dir)
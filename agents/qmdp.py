@@ -0,0 +1,144 @@
+# qmdp.py
+# Choosing actions with value function of the map computed in advance (QMDP)
+
+import hashlib
+import os
+
+import numpy as np
+
+from gridutil import *
+
+
+def rare_cell_rewards(model, rare_frac=0.1):
+    """
+    Returns reward for reaching each free location whose walls are rare on the map, zero elsewhere, as array of
+    free locations (see model.free). Walls around location are compared regardless of heading (as minimum of obstacle
+    codes over four headings), and location is rare when at most rare_frac of free locations have the same walls.
+    Reward is -log of that fraction, so percepts in rarer places are worth more.
+    """
+    n_dirs = len(model.directions)
+    codes = model.free_codes.reshape(-1, n_dirs)
+    signatures = codes.min(axis=1)
+    counts = np.bincount(signatures, minlength=1 << len(model.percept_names))
+    frac = counts[signatures] / len(signatures)
+    return np.where(frac <= rare_frac, -np.log(frac), 0.0)
+
+
+def goal_rewards(model, goal):
+    """
+    Returns reward 1 for reaching goal location (x, y) and zero elsewhere, as array of free locations
+    """
+    free_locs = np.flatnonzero(model.free.reshape(-1))
+    rewards = (free_locs == goal[0] * model.size + goal[1]).astype(float)
+    if not rewards.any():
+        raise ValueError(f"Goal {tuple(goal)} is not a free location")
+    return rewards
+
+
+class QMDPPolicy:
+    """
+    Assumes that robot's state becomes known after next action and chooses action with the highest expected value
+    over current posterior, given value of each action in each state, Q[action, free state]. Choosing an action is
+    then a single (3 x free states) matrix-vector product, with no search at runtime.
+
+    Q is computed with value iteration over free kernels of the model (see LocModel.free_kernel), all states at once.
+    Reward is given for reaching goal location if goal (x, y) is given, otherwise for reaching locations with rare
+    walls around (see rare_cell_rewards), where percepts tell the most about robot's location. Locations with reward
+    end the episode.
+
+    Q depends only on the map, eps_move and reward, so with cache_dir it's saved there and loaded for the same map
+    next time.
+    """
+
+    def __init__(self, model, goal=None, gamma=0.99, tol=1e-9, max_iter=10000, rare_frac=0.1, cache_dir=None):
+        self.model = model
+        self.goal = goal
+        self.gamma = gamma
+        self.tol = tol
+        self.max_iter = max_iter
+        self.rare_frac = rare_frac
+        self.order = [Action.FORWARD, Action.TURNLEFT, Action.TURNRIGHT]
+        # number of turns in a row chosen by action
+        self.turns = 0
+
+        # number of iterations of value iteration, 0 if Q was loaded from cache
+        self.iterations = 0
+        self.Q = None
+        path = os.path.join(cache_dir, f"qmdp_{self.cache_key()}.npz") if cache_dir is not None else None
+        if path is not None and os.path.exists(path):
+            with np.load(path) as data:
+                self.Q = data['Q']
+        if self.Q is None:
+            self.Q = self.value_iteration()
+            if path is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                np.savez(path, Q=self.Q)
+
+    def cache_key(self):
+        """
+        Returns hash of everything Q depends on: map, probability of failed move and reward
+        """
+        h = hashlib.sha1()
+        h.update(np.int64(self.model.size).tobytes())
+        h.update(np.packbits(self.model.free).tobytes())
+        h.update(np.float64([self.model.MOVE_FAILED, self.gamma, self.tol, self.rare_frac]).tobytes())
+        h.update(np.int64(self.max_iter).tobytes())
+        h.update(repr(tuple(self.goal) if self.goal is not None else None).encode())
+        return h.hexdigest()
+
+    def value_iteration(self):
+        """
+        Returns Q[action, free state] for actions in self.order. Reward of location is gained when robot moves into
+        it, states in rewarded locations are terminal and have value 0.
+        """
+        n_dirs = len(self.model.directions)
+        rewards = goal_rewards(self.model, self.goal) if self.goal is not None \
+            else rare_cell_rewards(self.model, self.rare_frac)
+        # reward and terminal flag of each free state
+        rewards = np.repeat(rewards, n_dirs)
+        terminal = rewards > 0
+
+        kernels = [self.model.free_kernel(action) for action in self.order]
+        stay = np.stack([T.stay for T in kernels])
+        succ = np.stack([T.succ for T in kernels])
+        move = np.stack([T.move for T in kernels])
+        # expected reward of each action, robot that stays in its state gains nothing
+        R = move * np.where(succ == np.arange(succ.shape[1]), 0.0, rewards[succ])
+
+        V = np.zeros(succ.shape[1])
+        Q = R
+        for self.iterations in range(1, self.max_iter + 1):
+            Q = R + self.gamma * (stay * V + move * V[succ])
+            Q[:, terminal] = 0.0
+            V_new = Q.max(axis=0)
+            converged = np.abs(V_new - V).max() <= self.tol
+            V = V_new
+            if converged:
+                break
+        return Q
+
+    def reset(self):
+        """
+        Forgets turns in a row, when actions were chosen in other way
+        """
+        self.turns = 0
+
+    def action(self, P, prev_action=None):
+        """
+        Returns Action with the highest expected value given posterior P as flat array of all states. Forward wins
+        ties.
+
+        QMDP doesn't value information, so when posterior is split between places where robot should turn
+        different ways, robot could turn in place forever. Turn opposite to prev_action is never chosen and after
+        three turns in a row robot has seen all sides of its location, so it moves forward.
+        """
+        if self.turns >= len(self.model.directions) - 1:
+            action = Action.FORWARD
+        else:
+            values = self.Q.dot(P[self.model.free_states])
+            undo = {Action.TURNLEFT: Action.TURNRIGHT, Action.TURNRIGHT: Action.TURNLEFT}.get(prev_action)
+            if undo is not None:
+                values[self.order.index(undo)] = -np.inf
+            action = self.order[int(np.argmax(values))]
+        self.turns = self.turns + 1 if action != Action.FORWARD else 0
+        return action
@@ -0,0 +1,56 @@
+# stats.py
+# Timing counters of phases of agent's steps
+
+import json
+import time
+
+
+class PhaseStats:
+    """
+    Counts calls and time spent in named phases of agent's steps (e.g. 'sensor', 'posterior[forward]'). Adding
+    one measurement is a dictionary lookup and three additions, so it can stay enabled in long runs.
+    """
+
+    def __init__(self):
+        # phase name -> [number of calls, total time, maximum time] in seconds
+        self.phases = {}
+
+    @staticmethod
+    def clock():
+        return time.perf_counter()
+
+    def add(self, phase, elapsed):
+        """
+        Adds one measurement of given phase
+        """
+        counter = self.phases.get(phase)
+        if counter is None:
+            counter = self.phases[phase] = [0, 0.0, 0.0]
+        counter[0] += 1
+        counter[1] += elapsed
+        if elapsed > counter[2]:
+            counter[2] = elapsed
+
+    def reset(self):
+        self.phases.clear()
+
+    def to_dict(self):
+        """
+        Returns number of calls, total time in seconds and mean and maximum time in milliseconds of each phase
+        """
+        return {phase: {'calls': calls, 'total_s': total, 'mean_ms': total / calls * 1e3, 'max_ms': max_time * 1e3}
+                for phase, (calls, total, max_time) in self.phases.items()}
+
+    def dump(self, path):
+        """
+        Writes statistics returned by to_dict to JSON file
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def __str__(self):
+        lines = [f"{'phase':<24}{'calls':>8}{'total s':>10}{'mean ms':>10}{'max ms':>10}"]
+        for phase, stats in self.to_dict().items():
+            lines.append(f"{phase:<24}{stats['calls']:>8}{stats['total_s']:>10.3f}{stats['mean_ms']:>10.3f}"
+                         f"{stats['max_ms']:>10.3f}")
+        return '\n'.join(lines)
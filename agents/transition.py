@@ -0,0 +1,202 @@
+# transition.py
+# Transition factors used by localization agents
+
+import numpy as np
+
+
+class SparseTransition:
+    """
+    Transition factor where robot from each state (location and direction) can only stay in this state or move to
+    exactly one successor state. Instead of (states x states) matrix it keeps three vectors, so memory and prediction
+    are linear in number of states.
+
+    No two states have the same successor, so each state can be reached from at most one other state. Prediction
+    uses this to gather probability from predecessors instead of scattering it to successors.
+    """
+
+    def __init__(self, stay, succ, move):
+        # probability that robot stayed in the same state
+        self.stay = stay
+        # index of state that robot reaches when action succeeds
+        self.succ = succ
+        # probability that robot reached successor state
+        self.move = move
+
+        states = np.arange(len(succ))
+        moved = (move > 0) & (succ != states)
+        # index of state from which robot could come to each state (itself if there is no such state)
+        self.pred = states.copy()
+        self.pred[succ[moved]] = states[moved]
+        # probability of coming from predecessor to each state
+        self.move_in = np.zeros(len(succ), float)
+        self.move_in[succ[moved]] = move[moved]
+
+        # logarithms of probabilities for prediction in log space (log(0) = -inf)
+        with np.errstate(divide='ignore'):
+            self.log_stay = np.log(self.stay)
+            self.log_move_in = np.log(self.move_in)
+
+    def predict(self, P):
+        """
+        Returns probability of each state after action, given probability P of each state before action.
+        States are stored along last axis of P.
+        """
+        return self.stay * P + self.move_in * P[..., self.pred]
+
+    def predict_support(self, support, P, dense_frac=0.03):
+        """
+        Returns states reachable from support (sorted indices of states) and their probabilities after action, given
+        probability P of each state in support. Cost depends on size of support, except when support is larger than
+        dense_frac of all states, then all states are predicted at once, which is cheaper than merging them.
+        """
+        n_states = len(self.succ)
+        if len(support) > dense_frac * n_states:
+            # support of all states is kept in order, so it needs no indexing
+            if len(support) < n_states:
+                full = np.zeros(n_states)
+                full[support] = P
+                P = full
+            return np.arange(n_states), self.predict(P)
+
+        states = np.concatenate([support, self.succ[support]])
+        probs = np.concatenate([P * self.stay[support], P * self.move[support]])
+        # the same state can be reached from itself and from its predecessor
+        new_support, idx = np.unique(states, return_inverse=True)
+        return new_support, np.bincount(idx, probs)
+
+    def log_predict(self, log_P):
+        """
+        The same as predict, but for logarithms of probabilities. Sums are done with logaddexp, so very small
+        probabilities don't underflow.
+        """
+        return np.logaddexp(self.log_stay + log_P, self.log_move_in + log_P[..., self.pred])
+
+    def toarray(self):
+        """
+        Returns factor as dense matrix, T[i, j] is probability of moving from state i to state j.
+        """
+        states = np.arange(len(self.succ))
+        T = np.zeros((len(self.succ), len(self.succ)), float)
+        T[states, states] = self.stay
+        T[states, self.succ] += self.move
+        return T
+
+
+class DenseTransition:
+    """
+    Transition factor stored as dense (states x states) matrix, T[i, j] is probability of moving from state i
+    to state j.
+    """
+
+    def __init__(self, T):
+        self.T = T
+
+    def predict(self, P):
+        """
+        Returns probability of each state after action, given probability P of each state before action.
+        States are stored along last axis of P.
+        """
+        return P.dot(self.T)
+
+    def log_predict(self, log_P):
+        """
+        The same as predict, but for logarithms of probabilities. Probabilities are scaled by the largest one
+        before exponentiating, so at least the most probable states don't underflow.
+        """
+        log_max = log_P.max(axis=-1, keepdims=True)
+        with np.errstate(divide='ignore'):
+            return np.log(self.predict(np.exp(log_P - log_max))) + log_max
+
+
+class StencilTransition:
+    """
+    Transition factor that works directly on (size x size x 4) grid of states without any matrix. Turning rolls
+    probability along direction axis and moving forward shifts each direction plane by one cell in its direction,
+    except for locations with wall in front.
+
+    Flattened states have the same order as SparseTransition and DenseTransition built over the grid, so factors
+    can be swapped.
+    """
+
+    # shift of location for each direction (N, E, S, W)
+    forward_neighbours = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+
+    def __init__(self, action, free, move_correct, move_failed):
+        self.action = action
+        self.size = free.shape[0]
+        self.MOVE_CORRECT = move_correct
+        self.MOVE_FAILED = move_failed
+
+        if action == 'forward':
+            # can_move[x, y, dir_idx] is True if robot in free location (x, y) facing dir_idx has free location in front
+            self.can_move = np.zeros(free.shape + (len(self.forward_neighbours),), bool)
+            for dir_idx, (dx, dy) in enumerate(self.forward_neighbours):
+                self.can_move[..., dir_idx] = free & self.shift(free, -dx, -dy)
+            self.stay = np.where(self.can_move, move_failed, 1.0)
+            self.move = np.where(self.can_move, move_correct, 0.0)
+        elif action not in ('turnleft', 'turnright'):
+            raise ValueError(f"Unknown action: {action}")
+
+        # logarithms of probabilities for prediction in log space (log(0) = -inf)
+        with np.errstate(divide='ignore'):
+            self.LOG_MOVE_CORRECT = np.log(move_correct)
+            self.LOG_MOVE_FAILED = np.log(move_failed)
+            if action == 'forward':
+                self.log_stay = np.log(self.stay)
+                self.log_move = np.log(self.move)
+
+    @staticmethod
+    def shift(grid, dx, dy):
+        """
+        Returns grid shifted by dx along first axis and dy along second axis, with False/0 shifted in.
+        """
+        out = np.zeros_like(grid)
+        size_x, size_y = grid.shape[:2]
+        out[max(dx, 0):size_x + min(dx, 0), max(dy, 0):size_y + min(dy, 0)] = \
+            grid[max(-dx, 0):size_x + min(-dx, 0), max(-dy, 0):size_y + min(-dy, 0)]
+        return out
+
+    def predict(self, P):
+        """
+        Returns probability of each state after action, given probability P of each state before action.
+        States are stored along last axis of P.
+        """
+        B = P.reshape(P.shape[:-1] + (self.size, self.size, len(self.forward_neighbours)))
+
+        if self.action == 'turnright':
+            # probability passes from N to E, from E to S etc.
+            out = self.MOVE_FAILED * B + self.MOVE_CORRECT * np.roll(B, 1, axis=-1)
+        elif self.action == 'turnleft':
+            # probability passes from E to N, from N to W etc.
+            out = self.MOVE_FAILED * B + self.MOVE_CORRECT * np.roll(B, -1, axis=-1)
+        else:
+            out = self.stay * B
+            moving = self.move * B
+            # pass probability of moving robots one cell in direction they are facing
+            out[..., :, 1:, 0] += moving[..., :, :-1, 0]
+            out[..., 1:, :, 1] += moving[..., :-1, :, 1]
+            out[..., :, :-1, 2] += moving[..., :, 1:, 2]
+            out[..., :-1, :, 3] += moving[..., 1:, :, 3]
+
+        return out.reshape(P.shape)
+
+    def log_predict(self, log_P):
+        """
+        The same as predict, but for logarithms of probabilities. Sums are done with logaddexp, so very small
+        probabilities don't underflow.
+        """
+        B = log_P.reshape(log_P.shape[:-1] + (self.size, self.size, len(self.forward_neighbours)))
+
+        if self.action == 'turnright':
+            out = np.logaddexp(self.LOG_MOVE_FAILED + B, self.LOG_MOVE_CORRECT + np.roll(B, 1, axis=-1))
+        elif self.action == 'turnleft':
+            out = np.logaddexp(self.LOG_MOVE_FAILED + B, self.LOG_MOVE_CORRECT + np.roll(B, -1, axis=-1))
+        else:
+            out = self.log_stay + B
+            moving = self.log_move + B
+            np.logaddexp(out[..., :, 1:, 0], moving[..., :, :-1, 0], out=out[..., :, 1:, 0])
+            np.logaddexp(out[..., 1:, :, 1], moving[..., :-1, :, 1], out=out[..., 1:, :, 1])
+            np.logaddexp(out[..., :, :-1, 2], moving[..., :, 1:, 2], out=out[..., :, :-1, 2])
+            np.logaddexp(out[..., :-1, :, 3], moving[..., 1:, :, 3], out=out[..., :-1, :, 3])
+
+        return out.reshape(log_P.shape)
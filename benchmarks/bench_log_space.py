@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+"""Compares linear and log space posterior updates of LocAgent on a random map"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agents
+
+
+def run(agent, percepts, actions):
+    """
+    Runs agent's posterior update over given percepts and actions. Returns mean time of one step in seconds.
+    """
+    start = time.perf_counter()
+    for percept, action in zip(percepts, actions):
+        agent.prev_action = action
+        agent.update_sensor_factor(percept)
+        agent.update_transition_factor()
+        agent.update_posterior()
+    return (time.perf_counter() - start) / len(percepts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=128, help='size of the map')
+    parser.add_argument('--steps', type=int, default=1000, help='number of steps')
+    parser.add_argument('--transition', default='sparse', help='transition factor of the agent')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    walls = [(x, y) for x in range(args.size) for y in range(args.size) if rng.random() < 0.3]
+    percepts = [[p for p in ('fwd', 'right', 'bckwd', 'left') if rng.random() < 0.5] for _ in range(args.steps)]
+    actions = [rng.choice(['turnleft', 'turnright', 'forward']) for _ in range(args.steps)]
+
+    linear = agents.prob.LocAgent(args.size, walls, 0.1, 0.05, transition=args.transition)
+    log = agents.prob.LocAgent(args.size, walls, 0.1, 0.05, transition=args.transition, log_space=True)
+
+    linear_time = run(linear, percepts, actions)
+    log_time = run(log, percepts, actions)
+
+    P = linear.get_posterior()
+    denormals = np.count_nonzero((P > 0) & (P < np.finfo(float).tiny))
+    print(f"map {args.size}x{args.size}, {args.steps} steps, {args.transition} transition")
+    print(f"linear: {linear_time * 1000:.3f} ms/step, {denormals} denormal probabilities at the end")
+    print(f"log:    {log_time * 1000:.3f} ms/step")
+    print(f"max difference of posteriors: {np.abs(P - log.get_posterior()).max():.3e}")
+
+
+if __name__ == '__main__':
+    main()
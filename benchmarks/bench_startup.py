@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+"""Checks that entry points start fast and don't import heavy modules they don't use"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that must not be imported just by starting headless runs
+HEAVY_MODULES = ['pgmpy', 'pandas', 'networkx', 'scipy', 'torch', 'tkinter', 'graphics']
+
+# entry points checked by default
+ENTRY_POINTS = ['main', 'simulate', 'experiments']
+
+
+def import_time(module):
+    """
+    Imports module in fresh interpreter. Returns time of the whole run and heavy modules that were imported.
+    """
+    code = (f"import sys; import {module}; "
+            f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True, text=True)
+    return time.perf_counter() - start, out.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('modules', nargs='*', default=ENTRY_POINTS, help='modules to import')
+    parser.add_argument('--runs', type=int, default=5, help='number of imports of each module')
+    parser.add_argument('--budget', type=float, default=1.0, help='maximum median startup time in seconds')
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        times = []
+        for _ in range(args.runs):
+            elapsed, heavy = import_time(module)
+            times.append(elapsed)
+        median = sorted(times)[len(times) // 2]
+
+        problems = []
+        if median > args.budget:
+            problems.append(f"slower than {args.budget:.2f} s")
+        if heavy:
+            problems.append(f"imports {', '.join(heavy)}")
+        failed = failed or bool(problems)
+
+        print(f"{module}: {median * 1000:.0f} ms {'FAIL: ' + '; '.join(problems) if problems else 'OK'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""Parameter sweeps of headless localization episodes on all CPU cores"""
+
+import argparse
+import csv
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import agents
+import maps
+import simulate
+
+
+# models of each (map, eps_perc, eps_move) configuration, set once in each worker process by init_worker
+worker_models = {}
+
+
+def init_worker(models):
+    global worker_models
+    worker_models = models
+
+
+def run_task(task):
+    """
+    Runs one chunk of episodes of one configuration in worker process. Returns configuration and step in which each
+    episode was localized.
+    """
+    config, n_episodes, n_steps, confidence, seed = task
+    map_name, eps_perc, eps_move, threshold = config
+    model = worker_models[(map_name, eps_perc, eps_move)]
+    loc_time = simulate.simulate(model, eps_perc, eps_move, n_episodes, n_steps, confidence,
+                                 np.random.default_rng(seed), threshold)
+    return config, loc_time
+
+
+def build_models(map_names, eps_percs, eps_moves):
+    """
+    Builds model of each map and noise levels once, workers share them read-only.
+    """
+    models = {}
+    for map_name in map_names:
+        map = maps.load_map(map_name)
+        walls = maps.map_occupancy(map)
+        for eps_perc, eps_move in itertools.product(eps_percs, eps_moves):
+            models[(map_name, eps_perc, eps_move)] = agents.model.LocModel(map.shape[0], walls, eps_perc, eps_move)
+    return models
+
+
+def run(map_names, eps_percs, eps_moves, thresholds, n_episodes, n_steps, confidence=0.85, chunk=500, seed=None,
+        workers=None):
+    """
+    Runs n_episodes episodes for each combination of parameters, split into chunks of at most chunk episodes which
+    are run in parallel. Each chunk gets its own seed spawned from seed, so results don't depend on number of
+    workers. Returns one row of statistics (see simulate.summary) for each combination.
+    """
+    models = build_models(map_names, eps_percs, eps_moves)
+    configs = list(itertools.product(map_names, eps_percs, eps_moves, thresholds))
+
+    tasks = []
+    for config in configs:
+        for start in range(0, n_episodes, chunk):
+            tasks.append((config, min(chunk, n_episodes - start), n_steps, confidence))
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    tasks = [task + (task_seed,) for task, task_seed in zip(tasks, seeds)]
+
+    loc_times = {config: [] for config in configs}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(models,)) as executor:
+        for config, loc_time in executor.map(run_task, tasks):
+            loc_times[config].append(loc_time)
+
+    rows = []
+    for config in configs:
+        map_name, eps_perc, eps_move, threshold = config
+        row = {'map': map_name, 'eps_perc': eps_perc, 'eps_move': eps_move, 'threshold': threshold,
+               'episodes': 0, 'localized': 0.0, 'mean': np.nan, 'median': np.nan, 'p90': np.nan}
+        row.update(simulate.summary(np.concatenate(loc_times[config])))
+        rows.append(row)
+    return rows
+
+
+def write_results(rows, path):
+    """
+    Writes rows of results as columns to .npz file or as CSV file otherwise
+    """
+    columns = list(rows[0].keys())
+    if path.endswith('.npz'):
+        np.savez(path, **{name: np.array([row[name] for row in rows]) for name in columns})
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--map', nargs='+', default=['default'], help="map files, 'default' is the map of main.py")
+    parser.add_argument('--eps-perc', nargs='+', type=float, default=[0.1], help='chances that perception is wrong')
+    parser.add_argument('--eps-move', nargs='+', type=float, default=[0.05], help='chances that robot will not move')
+    parser.add_argument('--threshold', nargs='+', type=float, default=[0.85],
+                        help='confidences above which heuristic stops exploring')
+    parser.add_argument('--confidence', type=float, default=0.85, help='probability of localized robot')
+    parser.add_argument('--episodes', type=int, default=10000, help='number of episodes of each configuration')
+    parser.add_argument('--steps', type=int, default=40, help='number of steps of each episode')
+    parser.add_argument('--chunk', type=int, default=500, help='number of episodes run at once by one worker')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default='results.csv', help='output file, .csv or .npz')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = run(args.map, args.eps_perc, args.eps_move, args.threshold, args.episodes, args.steps, args.confidence,
+               args.chunk, args.seed, args.workers)
+    elapsed = time.perf_counter() - start
+
+    write_results(rows, args.output)
+    print(f"{len(rows)} configurations, {len(rows) * args.episodes} episodes in {elapsed:.1f} s, "
+          f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,24 @@
 # gridutil.py
 #  Some useful functions for navigating square 2d grids
 
+from enum import IntEnum
+
 DIRECTIONS = "NESW"
 ORIENTATIONS = dict(N=(0,1), E=(1,0), S=(0,-1), W=(-1,0))
 
+# headings are also coded as indices into DIRECTIONS (0 - N, 1 - E, 2 - S, 3 - W)
+HEADING_OFFSETS = [ORIENTATIONS[d] for d in DIRECTIONS]
+
+def toHeading(d):
+    return DIRECTIONS.index(d) if isinstance(d, str) else d
+
+def nextHeading(h, inc):
+    return (h+inc) % len(DIRECTIONS)
+
 def nextDirection(d, inc):
-    return DIRECTIONS[(DIRECTIONS.index(d)+inc) % len(DIRECTIONS)]
+    if not isinstance(d, str):
+        return nextHeading(d, inc)
+    return DIRECTIONS[nextHeading(DIRECTIONS.index(d), inc)]
 
 def leftTurn(d):
     return nextDirection(d, -1)
@@ -15,7 +28,7 @@ def rightTurn(d):
 
 def nextLoc(loc, d):
     x,y = loc
-    dx, dy = ORIENTATIONS[d]
+    dx, dy = ORIENTATIONS[d] if isinstance(d, str) else HEADING_OFFSETS[d]
     return (x+dx, y+dy)
 
 def legalLoc(loc, n):
@@ -37,3 +50,30 @@ def adjacent(l1,l2):
     x2,y2 = l2
     return (abs(x1-x2) + abs(y2-y1)) == 1
 
+
+# percepts in order of bits in percept mask
+PERCEPTS = ['fwd', 'right', 'bckwd', 'left', 'bump']
+
+def perceptToMask(percept):
+    # percept given as mask already (also NumPy integer) is returned as it is
+    if hasattr(percept, '__index__'):
+        return percept.__index__()
+    return sum(1 << i for i, p in enumerate(PERCEPTS) if p in percept)
+
+def maskToPercept(mask):
+    return [p for i, p in enumerate(PERCEPTS) if mask & (1 << i)]
+
+
+# actions coded as integers, in order of ACTIONS
+class Action(IntEnum):
+    TURNLEFT = 0
+    TURNRIGHT = 1
+    FORWARD = 2
+
+ACTIONS = ['turnleft', 'turnright', 'forward']
+
+def toAction(action):
+    return Action(ACTIONS.index(action) if isinstance(action, str) else action)
+
+def actionName(action):
+    return action if isinstance(action, str) else ACTIONS[action]
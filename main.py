@@ -2,239 +2,246 @@
 
 """code template"""
 
-import random
+import argparse
+import bisect
+import os
 import numpy as np
 
-from pgmpy.models import BayesianModel
-from pgmpy.factors.discrete import TabularCPD
-from pgmpy.inference import VariableElimination
-
-from graphics import *
 from gridutil import *
 
 import agents
+import maps
+import trajectory
 
 
 class LocWorldEnv:
-    actions = "turnleft turnright forward".split()
+    """
+    Grid world with the robot. Walls are kept in occupancy grid and robot's heading as index into DIRECTIONS, so
+    percepts and moves are array lookups. agentDir gives heading as 'N', 'E', 'S' or 'W'.
+    """
+
+    actions = ACTIONS
 
-    def __init__(self, size, walls, eps_perc, eps_move):
+    def __init__(self, size, walls, eps_perc, eps_move, verbose=True, rng=None):
         self.size = size
+        # list of walls locations or occupancy grid (see maps.map_occupancy)
         self.walls = walls
-        self.action_sensors = []
-        self.locations = {*locations(self.size)}.difference(self.walls)
+        # print failed actions
+        self.verbose = verbose
+        # occupancy[x, y] is True if there's wall in location (x, y)
+        self.occupancy = maps.walls_occupancy(walls, size)
+        # occupancy with border of walls around the world, location (x, y) is blocked[x + 1, y + 1]. End of the world
+        # is then detected like any other wall
+        self.blocked = np.pad(self.occupancy, 1, constant_values=True)
+        # indices (x * size + y) of free locations
+        self.free_locs = np.flatnonzero(~self.occupancy)
         self.eps_perc = eps_perc
         self.eps_move = eps_move
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        # codes[x, y, heading] has bit rel_idx set if there's wall in relative direction rel_idx (forward, right,
+        # backward, left) of location (x, y) when robot has given heading
+        n_dirs = len(DIRECTIONS)
+        wall_dirs = np.stack([self.blocked[1 + dx:size + 1 + dx, 1 + dy:size + 1 + dy]
+                              for dx, dy in HEADING_OFFSETS], axis=-1)
+        rel_dirs = (np.arange(n_dirs)[:, np.newaxis] + np.arange(n_dirs)) % n_dirs
+        self.codes = (wall_dirs[:, :, rel_dirs] * (1 << np.arange(n_dirs))).sum(axis=-1).astype(np.uint8)
+
+        # percepts of four sensors are independent, so for each code we keep cumulative distribution of all 16
+        # percept masks and draw whole percept with a single random number. Sensor detects wall with probability
+        # 1 - eps_perc if it's there and eps_perc if it isn't
+        bits = 1 << np.arange(n_dirs)
+        correct = ((np.arange(16)[:, np.newaxis, np.newaxis] & bits) > 0) == \
+                  ((np.arange(16)[np.newaxis, :, np.newaxis] & bits) > 0)
+        mask_prob = np.where(correct, 1.0 - eps_perc, eps_perc).prod(axis=-1)
+        self.mask_cdf = np.cumsum(mask_prob, axis=1).tolist()
+
+        # robot bumped into wall in last action
+        self.bump = False
         self.reset()
 
     def reset(self):
-        self.agentLoc = random.choice(list(self.locations))
-        self.agentDir = random.choice(['N', 'E', 'S', 'W'])
+        self.agentLoc = divmod(int(self.rng.choice(self.free_locs)), self.size)
+        self.heading = int(self.rng.integers(len(DIRECTIONS)))
+        self.bump = False
+
+    @property
+    def agentDir(self):
+        return DIRECTIONS[self.heading]
+
+    @agentDir.setter
+    def agentDir(self, dir):
+        self.heading = DIRECTIONS.index(dir)
+
+    def getPerceptMask(self):
+        """
+        Returns percept as percept mask (see gridutil.perceptToMask)
+        """
+        x, y = self.agentLoc
+        cdf = self.mask_cdf[self.codes[x, y, self.heading]]
+        mask = min(bisect.bisect_right(cdf, self.rng.random() * cdf[-1]), len(cdf) - 1)
+        if self.bump:
+            mask |= perceptToMask(['bump'])
+            self.bump = False
+        return mask
 
     def getPercept(self):
-        p = self.action_sensors
-        self.action_sensors = []
-        rel_dirs = {'fwd': 0, 'right': 1, 'bckwd': 2, 'left': 3}
-        for rel_dir, incr in rel_dirs.items():
-            nh = nextLoc(self.agentLoc, nextDirection(self.agentDir, incr))
-            prob = 0.0 + self.eps_perc
-            if (not legalLoc(nh, self.size)) or nh in self.walls:
-                prob = 1.0 - self.eps_perc
-            if random.random() < prob:
-                p.append(rel_dir)
-
-        return p
+        return maskToPercept(self.getPerceptMask())
 
     def doAction(self, action):
+        """
+        Executes action given as name or Action
+        """
         points = -1
-        if action == "turnleft":
-            if random.random() < self.eps_move:
-                # small chance that the agent will not turn
-                print('Robot did not turn')
-            else:
-                self.agentDir = leftTurn(self.agentDir)
-        elif action == "turnright":
-            if random.random() < self.eps_move:
-                # small chance that the agent will not turn
-                print('Robot did not turn')
-            else:
-                self.agentDir = rightTurn(self.agentDir)
-        elif action == "forward":
-            if random.random() < self.eps_move:
-                # small chance that the agent will not move
-                print('Robot did not move')
-                loc = self.agentLoc
+        if isinstance(action, str):
+            action = ACTIONS.index(action)
+        # small chance that the agent will not turn or move
+        if self.rng.random() < self.eps_move:
+            if self.verbose:
+                print('Robot did not move' if action == Action.FORWARD else 'Robot did not turn')
+        elif action == Action.TURNLEFT:
+            self.heading = (self.heading - 1) % len(DIRECTIONS)
+        elif action == Action.TURNRIGHT:
+            self.heading = (self.heading + 1) % len(DIRECTIONS)
+        elif action == Action.FORWARD:
+            x, y = self.agentLoc
+            dx, dy = HEADING_OFFSETS[self.heading]
+            if self.blocked[x + 1 + dx, y + 1 + dy]:
+                self.bump = True
             else:
-                # normal forward move
-                loc = nextLoc(self.agentLoc, self.agentDir)
-            if legalLoc(loc, self.size) and loc not in self.walls:
-                self.agentLoc = loc
-            else:
-                self.action_sensors.append("bump")
+                self.agentLoc = (x + dx, y + dy)
         return points  # cost/benefit of action
 
     def finished(self):
         return False
 
 
-class LocView:
-    # LocView shows a view of a LocWorldEnv. Just hand it an env, and
-    #   a window will pop up.
-
-    Size = .2
-    Points = {'N': (0, -Size, 0, Size), 'E': (-Size, 0, Size, 0),
-              'S': (0, Size, 0, -Size), 'W': (Size, 0, -Size, 0)}
-
-    color = "black"
-
-    def __init__(self, state, height=800, title="Loc World"):
-        xySize = state.size
-        win = self.win = GraphWin(title, 1.33 * height, height, autoflush=False)
-        win.setBackground("gray99")
-        win.setCoords(-.5, -.5, 1.33 * xySize - .5, xySize - .5)
-        cells = self.cells = {}
-        self.dir_cells = {}
-        for x in range(xySize):
-            for y in range(xySize):
-                cells[(x, y)] = Rectangle(Point(x - .5, y - .5), Point(x + .5, y + .5))
-                cells[(x, y)].setWidth(2)
-                cells[(x, y)].draw(win)
-                for dir in DIRECTIONS:
-                    if dir == 'N':
-                        self.dir_cells[(x, y, dir)] = Circle(Point(x, y + .25), .15)
-                    elif dir == 'E':
-                        self.dir_cells[(x, y, dir)] = Circle(Point(x + .25, y), .15)
-                    elif dir == 'S':
-                        self.dir_cells[(x, y, dir)] = Circle(Point(x, y - .25), .15)
-                    elif dir == 'W':
-                        self.dir_cells[(x, y, dir)] = Circle(Point(x - .25, y), .15)
-                    self.dir_cells[(x, y, dir)].setWidth(1)
-                    self.dir_cells[(x, y, dir)].draw(win)
-        self.agt = None
-        self.arrow = None
-        ccenter = 1.167 * (xySize - .5)
-        # self.time = Text(Point(ccenter, (xySize - 1) * .75), "Time").draw(win)
-        # self.time.setSize(36)
-        # self.setTimeColor("black")
-
-        self.agentName = Text(Point(ccenter, (xySize - 1) * .5), "").draw(win)
-        self.agentName.setSize(20)
-        self.agentName.setFill("Orange")
-
-        self.info = Text(Point(ccenter, (xySize - 1) * .25), "").draw(win)
-        self.info.setSize(20)
-        self.info.setFace("courier")
-
-        self.update(state)
-
-    def setAgent(self, name):
-        self.agentName.setText(name)
-
-    # def setTime(self, seconds):
-    #     self.time.setText(str(seconds))
-
-    def setInfo(self, info):
-        self.info.setText(info)
-
-    def update(self, state, P=None):
-        # View state in exiting window
-        for loc, cell in self.cells.items():
-            if loc in state.walls:
-                cell.setFill("black")
-            else:
-                cell.setFill("white")
-                if P is not None:
-                    for i, dir in enumerate(DIRECTIONS):
-                        c = int(round(P[loc[0], loc[1], i] * 255))
-                        self.dir_cells[(loc[0], loc[1], dir)].setFill('#ff%02x%02x' % (255 - c, 255 - c))
-        if self.agt:
-            self.agt.undraw()
-        if state.agentLoc:
-            self.agt = self.drawArrow(state.agentLoc, state.agentDir, 5, self.color)
-
-    def drawArrow(self, loc, heading, width, color):
-        x, y = loc
-        dx0, dy0, dx1, dy1 = self.Points[heading]
-        p1 = Point(x + dx0, y + dy0)
-        p2 = Point(x + dx1, y + dy1)
-        a = Line(p1, p2)
-        a.setWidth(width)
-        a.setArrow('last')
-        a.setFill(color)
-        a.draw(self.win)
-        return a
-
-    def pause(self):
-        self.win.getMouse()
-
-    # def setTimeColor(self, c):
-    #     self.time.setTextColor(c)
-
-    def close(self):
-        self.win.close()
-
-
-def main():
-    random.seed()
+def save_snapshot(path, t, env, P):
+    """
+    Saves posterior and true location and direction of the agent in given step
+    """
+    np.savez_compressed(os.path.join(path, f"step_{t:05d}.npz"), step=t, posterior=P,
+                        loc=np.array(env.agentLoc), dir=env.heading)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Robot localization in grid world")
+    parser.add_argument('--headless', action='store_true', help='run without window and pauses')
+    parser.add_argument('--map', default='default', help="map file, 'default' is the built-in map")
+    parser.add_argument('--steps', type=int, default=40, help='number of actions to execute')
+    parser.add_argument('--seed', type=int, default=None, help='seed of random generators')
+    parser.add_argument('--eps-perc', type=float, default=0.1, help='chance that perception will be wrong')
+    parser.add_argument('--eps-move', type=float, default=0.05,
+                        help='chance that the agent will not move forward despite the command')
+    parser.add_argument('--renderer', choices=['circles', 'raster'], default='circles',
+                        help='draw posterior as circles or as one image (faster on large maps)')
+    parser.add_argument('--rate', type=float, default=1, help='rate of executing actions in window')
+    parser.add_argument('--snapshot-every', type=int, default=0,
+                        help='save posterior every given number of steps (0 - never)')
+    parser.add_argument('--snapshot-dir', default='snapshots', help='directory of saved posteriors')
+    parser.add_argument('--record', default=None, help='save percepts, actions and true states to given .npz file')
+    parser.add_argument('--record-posterior', action='store_true', help='save also posterior in each step')
+    parser.add_argument('--agent', choices=['histogram', 'particle'], default='histogram',
+                        help='exact posterior of every state or particle filter for large maps')
+    parser.add_argument('--particles', type=int, default=5000, help='initial number of particles of particle filter')
+    parser.add_argument('--support-eps', type=float, default=None,
+                        help='track only states with at least this probability (histogram agent)')
+    parser.add_argument('--policy', choices=['heuristic', 'infogain', 'planner', 'qmdp'], default='heuristic',
+                        help='wall-following heuristic, the most informative action, lookahead over several '
+                             'actions or value function of the map (histogram agent)')
+    parser.add_argument('--depth', type=int, default=2, help='number of actions planner looks ahead')
+    parser.add_argument('--budget', type=float, default=0.1, help='planning time of one step in seconds')
+    parser.add_argument('--goal', type=int, nargs=2, default=None, metavar=('X', 'Y'),
+                        help='location qmdp policy drives robot to, places with rare walls if not given')
+    parser.add_argument('--qmdp-cache', default='.qmdp_cache', help='directory of value functions of maps')
+    parser.add_argument('--stats', default=None, help='save time spent in phases of agent steps to given JSON file')
+    parser.add_argument('--quiet', action='store_true', help="don't print state of the agent in each step")
+    args = parser.parse_args(argv)
+
+    np.random.seed(args.seed)
     # rate of executing actions
-    rate = 1
+    rate = args.rate
     # chance that perception will be wrong
-    eps_perc = 0.1
+    eps_perc = args.eps_perc
     # chance that the agent will not move forward despite the command
-    eps_move = 0.05
+    eps_move = args.eps_move
     # number of actions to execute
-    n_steps = 40
-    # size of the environment
-    env_size = 16
+    n_steps = args.steps
     # map of the environment: 1 - wall, 0 - free
-    map = np.array([[1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                    [0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0],
-                    [1, 1, 0, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1, 1, 1],
-                    [1, 0, 0, 0, 1, 0, 1, 1, 0, 0, 0, 0, 0, 1, 1, 0],
-                    [0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0],
-                    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-                    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]])
-    # build the list of walls locations
-    walls = []
-    for i in range(map.shape[0]):
-        for j in range(map.shape[1]):
-            if map[i, j] == 1:
-                walls.append((j, env_size - i - 1))
+    map = maps.load_map(args.map)
+    # size of the environment
+    env_size = map.shape[0]
+    # occupancy grid of walls, passed to environment and agent as it is
+    walls = maps.map_occupancy(map)
 
     # create the environment and viewer
-    env = LocWorldEnv(env_size, walls, eps_perc, eps_move)
-    view = LocView(env)
+    env = LocWorldEnv(env_size, walls, eps_perc, eps_move, verbose=not args.quiet,
+                      rng=np.random.default_rng(args.seed))
+    view = None
+    if not args.headless:
+        # window is imported only when needed, headless runs don't need display
+        from graphics import update
+        from view import LocView, RasterLocView
+        view = RasterLocView(env) if args.renderer == 'raster' else LocView(env)
+
+    if args.snapshot_every > 0:
+        os.makedirs(args.snapshot_dir, exist_ok=True)
+
+    recorder = None
+    if args.record is not None:
+        recorder = trajectory.TrajectoryRecorder(map, eps_perc, eps_move, args.record_posterior)
 
     # create the agent
-    agent = agents.prob.LocAgent(env.size, env.walls, eps_perc, eps_move)
+    if args.agent == 'particle':
+        agent = agents.particle.ParticleLocAgent(env.size, env.walls, eps_perc, eps_move, n_particles=args.particles,
+                                                 verbose=not args.quiet, profile=args.stats is not None,
+                                                 rng=np.random.default_rng(args.seed))
+    else:
+        agent = agents.prob.LocAgent(env.size, env.walls, eps_perc, eps_move, verbose=not args.quiet,
+                                     profile=args.stats is not None, support_eps=args.support_eps,
+                                     policy=args.policy, planner_depth=args.depth, planner_budget=args.budget,
+                                     goal=args.goal, qmdp_cache=args.qmdp_cache)
     for t in range(n_steps):
-        print('step %d' % t)
+        if not args.quiet:
+            print('step %d' % t)
 
-        percept = env.getPercept()
+        # percept as mask, agent answers it with Action
+        percept = env.getPerceptMask()
 
         action = agent(percept)
 
-        # get what the agent thinks of the environment
-        P = agent.get_posterior()
+        # get what the agent thinks of the environment, only when it's shown or saved. Particle filter builds
+        # posterior of the whole map for it, which costs more than its step
+        snapshot = args.snapshot_every > 0 and t % args.snapshot_every == 0
+        P = None
+        if snapshot or view is not None or (recorder is not None and recorder.record_posterior):
+            P = agent.get_posterior()
 
-        view.update(env, P)
-        update(rate)
-        # uncomment to pause before action
-        view.pause()
+        if snapshot:
+            save_snapshot(args.snapshot_dir, t, env, P)
+
+        if recorder is not None:
+            recorder.record(percept, action, env.agentLoc, env.heading, P)
+
+        if view is not None:
+            view.update(env, P)
+            update(rate)
+            # uncomment to pause before action
+            view.pause()
 
         env.doAction(action)
 
-    # pause until mouse clicked
-    view.pause()
+    if recorder is not None:
+        recorder.save(args.record)
+
+    if agent.stats is not None:
+        agent.stats.dump(args.stats)
+        if not args.quiet:
+            print(agent.stats)
+
+    if view is not None:
+        # pause until mouse clicked
+        view.pause()
 
 
 if __name__ == '__main__':
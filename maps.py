@@ -0,0 +1,115 @@
+# maps.py
+#  Maps of the environment and helpers for converting them
+
+import numpy as np
+
+
+# map of the environment: 1 - wall, 0 - free. Row i and column j of the map is location (j, size - i - 1)
+DEFAULT_MAP = np.array([[1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                        [0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0],
+                        [1, 1, 0, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1, 1, 1],
+                        [1, 0, 0, 0, 1, 0, 1, 1, 0, 0, 0, 0, 0, 1, 1, 0],
+                        [0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0],
+                        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]])
+
+
+def map_occupancy(map):
+    """
+    Returns occupancy grid of the map, occupancy[x, y] is True if there's wall in location (x, y)
+    """
+    return np.asarray(map)[::-1].T != 0
+
+
+def map_walls(map):
+    """
+    Returns list of walls locations of the map
+    """
+    xs, ys = np.nonzero(map_occupancy(map))
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+def walls_occupancy(walls, size):
+    """
+    Returns occupancy grid (see map_occupancy) of the world of given size. walls is either occupancy grid, which is
+    returned as it is, or list of walls locations.
+    """
+    if isinstance(walls, np.ndarray) and walls.shape == (size, size):
+        return walls.astype(bool, copy=False)
+    occupancy = np.zeros((size, size), bool)
+    walls_arr = np.array(list(walls), int).reshape(-1, 2)
+    occupancy[walls_arr[:, 0], walls_arr[:, 1]] = True
+    return occupancy
+
+
+def read_pgm(path):
+    """
+    Returns pixels of PGM image (rows, columns). Binary (P5) images are memory-mapped, plain (P2) ones are parsed.
+    """
+    with open(path, 'rb') as f:
+        data = f.read(1024)
+
+    # header is magic number, width, height and maximum value separated by whitespace, with # comments
+    fields = []
+    pos = 0
+    while len(fields) < 4:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b'#':
+            pos = data.index(b'\n', pos)
+            continue
+        end = pos
+        while end < len(data) and not data[end:end + 1].isspace():
+            end += 1
+        fields.append(data[pos:end])
+        pos = end
+    magic, width, height, max_value = fields[0], int(fields[1]), int(fields[2]), int(fields[3])
+
+    if magic == b'P5':
+        # single whitespace separates header from pixels
+        dtype = np.uint8 if max_value < 256 else np.dtype('>u2')
+        pixels = np.memmap(path, dtype, 'r', offset=pos + 1, shape=(height, width))
+    elif magic == b'P2':
+        with open(path, 'rb') as f:
+            pixels = np.array(f.read()[pos:].split(), int).reshape(height, width)
+    else:
+        raise ValueError(f"Unknown PGM format of {path}: {magic}")
+    return pixels, max_value
+
+
+def load_map(path):
+    """
+    Loads map, 1 - wall, 0 - free. 'default' returns DEFAULT_MAP. Format is chosen by extension of the file:
+    - .npy - NumPy array, memory-mapped
+    - .bin - raw square grid of bytes (nonzero is wall), memory-mapped
+    - .pgm - PGM image, dark pixels (below half of maximum value) are walls
+    - others - text file with one row of the map per line
+    Memory-mapped maps are read from disk only when used, so large floor plans don't have to fit in memory twice.
+    """
+    if path == 'default':
+        return DEFAULT_MAP
+    if path.endswith('.npy'):
+        map = np.load(path, mmap_mode='r')
+    elif path.endswith('.bin'):
+        map = np.memmap(path, np.uint8, 'r')
+        size = int(round(np.sqrt(len(map))))
+        if size * size != len(map):
+            raise ValueError(f"Map {path} is not square: {len(map)} cells")
+        map = map.reshape(size, size)
+    elif path.endswith('.pgm'):
+        pixels, max_value = read_pgm(path)
+        map = pixels < (max_value + 1) / 2
+    else:
+        map = np.loadtxt(path, dtype=int, ndmin=2)
+    if map.ndim != 2 or map.shape[0] != map.shape[1]:
+        raise ValueError(f"Map {path} is not square: {map.shape}")
+    return map
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""Headless simulation of many localization episodes at once"""
+
+import argparse
+import time
+
+import numpy as np
+
+from gridutil import *
+
+import agents
+import maps
+
+
+class BatchLocWorldEnv:
+    """
+    Many independent LocWorldEnv episodes on the same map. Locations and directions of all robots are kept in
+    arrays and percepts and actions of all robots are simulated at once.
+
+    Robot is in location index cells[i] (x * size + y) and faces direction headings[i] (0 - N, 1 - E, 2 - S, 3 - W).
+    """
+
+    def __init__(self, model, eps_perc, eps_move, n_episodes, rng=None):
+        # map-derived model, only walls in front of each location are used
+        self.model = model
+        self.size = model.size
+        self.eps_perc = eps_perc
+        self.eps_move = eps_move
+        self.n_episodes = n_episodes
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.reset()
+
+    def reset(self):
+        self.cells = self.rng.choice(np.flatnonzero(self.model.free), self.n_episodes)
+        self.headings = self.rng.integers(0, 4, self.n_episodes)
+        # bump of robots from last action
+        self.bumps = np.zeros(self.n_episodes, bool)
+
+    def getPercepts(self):
+        """
+        Returns percept mask (see gridutil.perceptToMask) of each robot
+        """
+        # walls in relative directions (forward, right, backward, left) of each robot
+        rel_dirs = (self.headings[:, np.newaxis] + np.arange(4)) % 4
+        walls = self.model.blocked[self.cells[:, np.newaxis], rel_dirs]
+        # sensor detects wall with probability 1 - eps_perc if it's there and eps_perc if it isn't
+        prob = np.where(walls, 1.0 - self.eps_perc, self.eps_perc)
+        detected = self.rng.random(prob.shape) < prob
+
+        masks = (detected * (1 << np.arange(4))).sum(axis=1) | np.where(self.bumps, 1 << 4, 0)
+        self.bumps[:] = False
+        return masks
+
+    def doActions(self, actions):
+        """
+        Executes action of each robot given as gridutil.Action
+        """
+        # small chance that the robot will not move
+        moved = self.rng.random(self.n_episodes) >= self.eps_move
+
+        turn = np.where(actions == Action.TURNLEFT, -1, np.where(actions == Action.TURNRIGHT, 1, 0))
+        self.headings = np.where(moved, (self.headings + turn) % 4, self.headings)
+
+        forward_moved = moved & (actions == Action.FORWARD)
+        blocked = self.model.blocked[self.cells, self.headings]
+        self.bumps = forward_moved & blocked
+        go = forward_moved & ~blocked
+        self.cells = np.where(go, self.model.neighbours[self.cells, self.headings], self.cells)
+
+
+def simulate(model, eps_perc, eps_move, n_episodes, n_steps, confidence=0.85, rng=None, threshold=None):
+    """
+    Runs n_episodes episodes of n_steps steps at once. Returns step in which each episode was localized, that is
+    most probable location and direction was the true one with probability at least confidence, or -1 if it
+    wasn't localized.
+
+    threshold is confidence above which heuristic of robots stops exploring, the same as confidence by default.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    threshold = threshold if threshold is not None else confidence
+    env = BatchLocWorldEnv(model, eps_perc, eps_move, n_episodes, rng)
+    agent = agents.batch.BatchLocAgent(model.size, model.walls, eps_perc, eps_move, n_episodes, model=model,
+                                       confidence=threshold, rng=rng)
+
+    loc_time = np.full(n_episodes, -1)
+    for t in range(n_steps):
+        percepts = env.getPercepts()
+        actions = agent(percepts)
+
+        x, y, dir_idx, prob = agent.most_probable()
+        localized = (x * model.size + y == env.cells) & (dir_idx == env.headings) & (prob >= confidence)
+        loc_time[localized & (loc_time < 0)] = t
+
+        env.doActions(actions)
+
+    return loc_time
+
+
+def summary(loc_time):
+    """
+    Returns statistics of localization times returned by simulate
+    """
+    localized = loc_time[loc_time >= 0]
+    stats = {'episodes': len(loc_time), 'localized': len(localized) / len(loc_time)}
+    if len(localized) > 0:
+        stats.update(mean=localized.mean(), median=np.median(localized), p90=np.percentile(localized, 90))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--episodes', type=int, default=1000, help='number of episodes')
+    parser.add_argument('--steps', type=int, default=40, help='number of steps of each episode')
+    parser.add_argument('--eps-perc', type=float, default=0.1, help='chance that perception will be wrong')
+    parser.add_argument('--eps-move', type=float, default=0.05, help='chance that the robot will not move')
+    parser.add_argument('--confidence', type=float, default=0.85, help='probability of localized robot')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    map = maps.DEFAULT_MAP
+    model = agents.model.LocModel(map.shape[0], maps.map_occupancy(map), args.eps_perc, args.eps_move)
+
+    start = time.perf_counter()
+    loc_time = simulate(model, args.eps_perc, args.eps_move, args.episodes, args.steps, args.confidence,
+                        np.random.default_rng(args.seed))
+    elapsed = time.perf_counter() - start
+
+    for name, value in summary(loc_time).items():
+        print(f"{name}: {value:g}")
+    print(f"{args.episodes / elapsed:.0f} episodes/s")
+
+
+if __name__ == '__main__':
+    main()
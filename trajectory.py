@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+"""Replay of recorded localization runs with LocAgent"""
+
+import argparse
+import time
+
+import numpy as np
+
+from gridutil import *
+
+import agents
+import maps
+
+
+class TrajectoryRecorder:
+    """
+    Records percept, action and true location and direction of the robot (and optionally posterior of the agent)
+    in each step of a run, together with map and noise levels needed to replay it.
+
+    Percepts are stored as percept masks (see gridutil.perceptToMask), actions as gridutil.Action and directions as
+    headings (see gridutil.toHeading).
+    """
+
+    def __init__(self, map, eps_perc, eps_move, record_posterior=False):
+        self.map = map
+        self.eps_perc = eps_perc
+        self.eps_move = eps_move
+        self.record_posterior = record_posterior
+        self.percepts = []
+        self.actions = []
+        self.locs = []
+        self.dirs = []
+        self.posteriors = []
+
+    def record(self, percept, action, loc, dir, P=None):
+        """
+        Records one step: percept the agent got, action it returned for it and true location and direction of the
+        robot before executing the action.
+        """
+        self.percepts.append(perceptToMask(percept))
+        self.actions.append(toAction(action))
+        self.locs.append(loc)
+        self.dirs.append(toHeading(dir))
+        if self.record_posterior:
+            # posterior of the agent may be a view that changes in next steps
+            self.posteriors.append(np.array(P))
+
+    def save(self, path):
+        """
+        Saves recorded steps to compressed .npz file
+        """
+        arrays = dict(map=self.map, eps_perc=self.eps_perc, eps_move=self.eps_move,
+                      percepts=np.array(self.percepts, np.uint8), actions=np.array(self.actions, np.uint8),
+                      locs=np.array(self.locs, np.int32).reshape(-1, 2), dirs=np.array(self.dirs, np.uint8))
+        if self.record_posterior:
+            arrays['posteriors'] = np.array(self.posteriors)
+        np.savez_compressed(path, **arrays)
+
+
+def load_trajectory(path):
+    """
+    Loads trajectory saved by TrajectoryRecorder as dictionary of arrays
+    """
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def replay(trajectory, transition='sparse', log_space=False):
+    """
+    Runs LocAgent over recorded percepts and actions without LocWorldEnv. Agent's own choice of action is replaced by
+    the recorded one, so it gets exactly the same inputs as in the recorded run. Returns posterior of the agent in
+    each step (steps, x, y, direction).
+    """
+    map = trajectory['map']
+    agent = agents.prob.LocAgent(map.shape[0], maps.map_occupancy(map), float(trajectory['eps_perc']),
+                                 float(trajectory['eps_move']), transition=transition, log_space=log_space,
+                                 verbose=False)
+
+    posteriors = np.empty((len(trajectory['percepts']),) + agent.get_posterior().shape)
+    for t, (mask, action) in enumerate(zip(trajectory['percepts'], trajectory['actions'])):
+        agent(mask)
+        posteriors[t] = agent.get_posterior()
+        # transition factor of the next step follows the action executed in the recorded run
+        agent.prev_action = Action(action)
+
+    return posteriors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('path', help='trajectory recorded with main.py --record')
+    parser.add_argument('--transition', choices=['sparse', 'stencil', 'dense'], default='sparse',
+                        help='transition factor of the agent')
+    parser.add_argument('--log-space', action='store_true', help='update posterior in log space')
+    args = parser.parse_args()
+
+    trajectory = load_trajectory(args.path)
+    n_steps = len(trajectory['percepts'])
+
+    start = time.perf_counter()
+    posteriors = replay(trajectory, args.transition, args.log_space)
+    elapsed = time.perf_counter() - start
+    print(f"{n_steps} steps in {elapsed:.3f} s ({elapsed / max(n_steps, 1) * 1e3:.3f} ms/step)")
+
+    # probability of the true location and direction in each step
+    steps = np.arange(n_steps)
+    locs, dirs = trajectory['locs'], trajectory['dirs']
+    true_prob = posteriors[steps, locs[:, 0], locs[:, 1], dirs]
+    print(f"probability of true state: mean {true_prob.mean():.3f}, last {true_prob[-1]:.3f}")
+
+    if 'posteriors' in trajectory:
+        err = np.abs(posteriors - trajectory['posteriors']).max()
+        print(f"max difference from recorded posterior: {err:.3g}")
+
+
+if __name__ == '__main__':
+    main()
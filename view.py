@@ -0,0 +1,229 @@
+# view.py
+#  Window showing LocWorldEnv and posterior of the agent
+
+import numpy as np
+
+from graphics import *
+from gridutil import *
+
+
+class LocView:
+    # LocView shows a view of a LocWorldEnv. Just hand it an env, and
+    #   a window will pop up.
+
+    Size = .2
+    Points = {'N': (0, -Size, 0, Size), 'E': (-Size, 0, Size, 0),
+              'S': (0, Size, 0, -Size), 'W': (Size, 0, -Size, 0)}
+
+    color = "black"
+
+    def __init__(self, state, height=800, title="Loc World", quantum=1):
+        xySize = state.size
+        win = self.initWindow(state, height, title)
+        cells = self.cells = {}
+        self.dir_cells = {}
+        for x in range(xySize):
+            for y in range(xySize):
+                cells[(x, y)] = Rectangle(Point(x - .5, y - .5), Point(x + .5, y + .5))
+                cells[(x, y)].setWidth(2)
+                cells[(x, y)].draw(win)
+                for dir in DIRECTIONS:
+                    if dir == 'N':
+                        self.dir_cells[(x, y, dir)] = Circle(Point(x, y + .25), .15)
+                    elif dir == 'E':
+                        self.dir_cells[(x, y, dir)] = Circle(Point(x + .25, y), .15)
+                    elif dir == 'S':
+                        self.dir_cells[(x, y, dir)] = Circle(Point(x, y - .25), .15)
+                    elif dir == 'W':
+                        self.dir_cells[(x, y, dir)] = Circle(Point(x - .25, y), .15)
+                    self.dir_cells[(x, y, dir)].setWidth(1)
+                    self.dir_cells[(x, y, dir)].draw(win)
+        self.arrow = None
+
+        # walls don't change, so cells are filled only once
+        self.free = ~state.occupancy
+        for loc, cell in cells.items():
+            cell.setFill("white" if self.free[loc] else "black")
+
+        # colour intensity (0-255) last drawn in each circle. Circle is redrawn only when its intensity changes
+        # by at least quantum, so each update reconfigures only changed circles instead of all of them
+        self.quantum = quantum
+        self.levels = np.full((xySize, xySize, len(DIRECTIONS)), -256)
+
+        self.update(state)
+
+    def initWindow(self, state, height, title):
+        # Opens window with grid of the world in its left part (height x height pixels) and texts on the right
+        xySize = state.size
+        win = self.win = GraphWin(title, 1.33 * height, height, autoflush=False)
+        win.setBackground("gray99")
+        win.setCoords(-.5, -.5, 1.33 * xySize - .5, xySize - .5)
+
+        self.agt = None
+        ccenter = 1.167 * (xySize - .5)
+        # self.time = Text(Point(ccenter, (xySize - 1) * .75), "Time").draw(win)
+        # self.time.setSize(36)
+        # self.setTimeColor("black")
+
+        self.agentName = Text(Point(ccenter, (xySize - 1) * .5), "").draw(win)
+        self.agentName.setSize(20)
+        self.agentName.setFill("Orange")
+
+        self.info = Text(Point(ccenter, (xySize - 1) * .25), "").draw(win)
+        self.info.setSize(20)
+        self.info.setFace("courier")
+        return win
+
+    def setAgent(self, name):
+        self.agentName.setText(name)
+
+    # def setTime(self, seconds):
+    #     self.time.setText(str(seconds))
+
+    def setInfo(self, info):
+        self.info.setText(info)
+
+    def update(self, state, P=None):
+        # View state in exiting window
+        if P is not None:
+            levels = np.rint(np.asarray(P) * 255).astype(int)
+            changed = (np.abs(levels - self.levels) >= self.quantum) & self.free[:, :, np.newaxis]
+            for x, y, i in zip(*np.nonzero(changed)):
+                c = levels[x, y, i]
+                self.dir_cells[(int(x), int(y), DIRECTIONS[i])].setFill('#ff%02x%02x' % (255 - c, 255 - c))
+                self.levels[x, y, i] = c
+        if self.agt:
+            self.agt.undraw()
+        if state.agentLoc:
+            self.agt = self.drawArrow(state.agentLoc, state.agentDir, 5, self.color)
+        # push all changes to the window at once
+        self.win.flush()
+
+    def drawArrow(self, loc, heading, width, color):
+        x, y = loc
+        dx0, dy0, dx1, dy1 = self.Points[heading]
+        p1 = Point(x + dx0, y + dy0)
+        p2 = Point(x + dx1, y + dy1)
+        a = Line(p1, p2)
+        a.setWidth(width)
+        a.setArrow('last')
+        a.setFill(color)
+        a.draw(self.win)
+        return a
+
+    def pause(self):
+        self.win.getMouse()
+
+    # def setTimeColor(self, c):
+    #     self.time.setTextColor(c)
+
+    def close(self):
+        self.win.close()
+
+
+class RasterLocView(LocView):
+    # RasterLocView shows the same view as LocView, but posterior of all locations and directions is drawn as one
+    #   image. Number of canvas items doesn't depend on size of the world, so it can show large maps.
+
+    # position of pixel of each direction (N, E, S, W) in 3x3 block of pixels of a location
+    dir_pixels = [(0, 1), (1, 2), (2, 1), (1, 0)]
+
+    def __init__(self, state, height=800, title="Loc World"):
+        xySize = state.size
+        win = self.initWindow(state, height, title)
+
+        # image covers the grid part of the window, height pixels for xySize locations, so each location spans
+        # height / xySize pixels like in LocView. Location is drawn as 3x3 block of pixels scaled to that size
+        # (nearest pixel). On maps with more than height / 3 locations in a row several block pixels fall into one
+        # pixel of the image, which then shows the most probable of their states
+        center = Point((xySize - 1) / 2, (xySize - 1) / 2)
+        self.image = Image(center, height, height)
+        self.image.draw(win)
+
+        # free[row, col] is True if location shown in given row and column of blocks is not a wall, first row
+        # is the top of the world
+        self.free = ~state.occupancy.T[::-1]
+
+        # pixel of the block shown by each row (and column) of the image
+        block_pixels = np.arange(height) * 3 * xySize // height
+        # row (column) of blocks of each row (column) of the image
+        self.rows = block_pixels // 3
+        # direction shown by each pixel of the image, len(DIRECTIONS) for pixels that don't show any direction
+        block_dirs = np.full((3, 3), len(DIRECTIONS))
+        for dir_idx, (row, col) in enumerate(self.dir_pixels):
+            block_dirs[row, col] = dir_idx
+        self.pixel_dirs = block_dirs[block_pixels[:, np.newaxis] % 3, block_pixels[np.newaxis, :] % 3]
+        # free_pixels[row, col] is True if pixel of the image shows free location
+        self.free_pixels = self.free[self.rows[:, np.newaxis], self.rows[np.newaxis, :]]
+
+        # when pixels of blocks are smaller than pixels of the image, posterior is max-pooled into image pixels. For
+        # each direction pool_bins holds rows (columns) of the image which show any block pixel of this direction
+        # and index of the first block in each of them, see rasterize
+        self.pool_bins = None
+        if 3 * xySize > height:
+            self.pool_bins = []
+            for row, col in self.dir_pixels:
+                # row (column) of the image showing the direction pixel of each row (column) of blocks
+                row_bins = (3 * np.arange(xySize) + row) * height // (3 * xySize)
+                col_bins = (3 * np.arange(xySize) + col) * height // (3 * xySize)
+                self.pool_bins.append(np.unique(row_bins, return_index=True) +
+                                      np.unique(col_bins, return_index=True))
+
+        self.update(state)
+
+    def rasterize(self, P=None):
+        """
+        Returns RGB pixels (rows, columns, 3) of the image of posterior P (x, y, direction). Walls are black, free
+        locations white with pixel of each direction as red as probable it is.
+        """
+        if self.pool_bins is not None:
+            return self.rasterize_pooled(P)
+
+        n = self.free.shape[0]
+        # probability levels of each direction of each block, last one is always 0 for pixels without direction
+        levels = np.zeros((n, n, len(DIRECTIONS) + 1), np.uint8)
+        if P is not None:
+            # rows of blocks go from the top of the world
+            levels[:, :, :len(DIRECTIONS)] = np.rint(np.asarray(P) * 255).astype(np.uint8).transpose(1, 0, 2)[::-1]
+        # green and blue channels of each pixel
+        gb = 255 - levels[self.rows[:, np.newaxis], self.rows[np.newaxis, :], self.pixel_dirs]
+        # walls are black in all channels
+        gb[~self.free_pixels] = 0
+        red = np.where(self.free_pixels, 255, 0).astype(np.uint8)
+        return np.stack([red, gb, gb], axis=-1)
+
+    def rasterize_pooled(self, P=None):
+        """
+        The same as rasterize, but each pixel of the image is as red as the most probable of all states whose block
+        pixels fall into it, so no state is skipped on maps with more locations than pixels. Walls are black, unless
+        the pixel shows also probable state of free location.
+        """
+        height = len(self.rows)
+        # maximum probability of states shown in each pixel of the image
+        pooled = np.zeros((height, height))
+        if P is not None:
+            # rows of blocks go from the top of the world
+            P = np.asarray(P).transpose(1, 0, 2)[::-1]
+            for dir_idx, (rows, row_starts, cols, col_starts) in enumerate(self.pool_bins):
+                block_max = np.maximum.reduceat(np.maximum.reduceat(P[:, :, dir_idx], row_starts, axis=0),
+                                                col_starts, axis=1)
+                view = np.ix_(rows, cols)
+                pooled[view] = np.maximum(pooled[view], block_max)
+        levels = np.rint(pooled * 255).astype(np.uint8)
+
+        shown = self.free_pixels | (levels > 0)
+        gb = np.where(shown, 255 - levels, 0).astype(np.uint8)
+        red = np.where(shown, 255, 0).astype(np.uint8)
+        return np.stack([red, gb, gb], axis=-1)
+
+    def update(self, state, P=None):
+        # View state in exiting window, whole posterior is replaced by one image in PPM format
+        rgb = self.rasterize(P)
+        header = b'P6 %d %d 255\n' % (rgb.shape[1], rgb.shape[0])
+        self.image.img.configure(data=header + rgb.tobytes(), format='PPM')
+
+        if self.agt:
+            self.agt.undraw()
+        if state.agentLoc:
+            self.agt = self.drawArrow(state.agentLoc, state.agentDir, 5, self.color)
+        self.win.flush()